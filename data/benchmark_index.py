@@ -0,0 +1,68 @@
+import pandas as pd
+import numpy as np
+from timeit import timeit
+
+from stores import StatAccumulator, ColumnarStore
+
+# micro-benchmark of a single match of the build: rows for both lineups, a stream of counter updates coming
+# from events and the previous-round lookup of update_injuries, done with DataFrame masks (as build() did
+# before) and with the (id, season, round) index of StatAccumulator/ColumnarStore
+
+N_PLAYERS = 36
+N_EVENTS = 100
+N_PREVIOUS = 10000
+SEASON = 2014
+
+cols = ["id", "name", "season", "round", "date", "team"] + [f"stat{i}" for i in range(22)]
+stat_cols = cols[6:]
+rng = np.random.default_rng(0)
+updates = [(f"/players/p{rng.integers(N_PLAYERS)}/", stat_cols[rng.integers(len(stat_cols))])
+           for _ in range(N_EVENTS * 2)]
+
+
+def previous_rounds():
+    return [[f"/players/p{i % N_PLAYERS}/", "", SEASON, i // N_PLAYERS + 1, "2014-01-01", ""] + [0] * len(stat_cols)
+            for i in range(N_PREVIOUS)]
+
+
+def match_with_masks(prev_db):
+    df = pd.DataFrame(columns=cols)
+    for i in range(N_PLAYERS):
+        df.loc[len(df)] = [f"/players/p{i}/", "", SEASON, 2, "2014-01-08", ""] + [0] * len(stat_cols)
+    for pl_id, column in updates:
+        df.loc[(df["id"] == pl_id) & (df["season"] == SEASON) & (df["round"] == 2), column] += 1
+    for i in range(N_PLAYERS):
+        pl_id = f"/players/p{i}/"
+        prev_db.loc[(prev_db["id"] == pl_id) & (prev_db["season"] == SEASON) & (prev_db["round"] == 1),
+                    "stat0"].values[0]
+    return df
+
+
+def match_with_index(prev_db):
+    acc = StatAccumulator(cols, ["id", "season", "round"], 6)
+    for i in range(N_PLAYERS):
+        acc.add_row([f"/players/p{i}/", "", SEASON, 2, "2014-01-08", ""])
+    for pl_id, column in updates:
+        acc.add((pl_id, SEASON, 2), column)
+    for i in range(N_PLAYERS):
+        prev_db.get((f"/players/p{i}/", SEASON, 1), "stat0")
+    return acc.to_frame()
+
+
+if __name__ == "__main__":
+    prev_frame = pd.DataFrame(previous_rounds(), columns=cols)
+    prev_store = ColumnarStore(cols, ["id", "season", "round"], 6)
+    prev_acc = StatAccumulator(cols, ["id", "season", "round"], 6)
+    for row in previous_rounds():
+        prev_acc.add_row(row[:6])
+    prev_store.extend(prev_acc)
+
+    assert match_with_masks(prev_frame).astype(str).equals(match_with_index(prev_store).astype(str))
+
+    n = 5
+    before = timeit(lambda: match_with_masks(prev_frame), number=n) / n
+    after = timeit(lambda: match_with_index(prev_store), number=n) / n
+    print(f"per match, {N_PLAYERS} players, {N_EVENTS * 2} updates, {N_PREVIOUS} rows in the global table")
+    print(f"{'DataFrame masks:':30}{before * 1000:9.2f} ms")
+    print(f"{'(id, season, round) index:':30}{after * 1000:9.2f} ms")
+    print(f"{'speedup:':30}{before / after:9.1f}x")
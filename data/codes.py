@@ -0,0 +1,41 @@
+import pandas as pd
+
+# team names of ginf, events and lineups kept as categoricals sharing one set of categories, every row holds an int
+# code instead of its own string and equality masks and merges between the frames compare the codes
+
+TEAM_COLUMNS = {"ginf": ["ht", "at"], "events": ["event_team", "opponent"], "lineups": ["home_team", "away_team"]}
+
+
+# categories of all the team names in the given columns
+def team_dtype(columns):
+    names = pd.concat([pd.Series(column, dtype=object) for column in columns]).dropna().unique()
+    return pd.CategoricalDtype(sorted(names))
+
+
+# replaces the team columns of the frames (by name as in TEAM_COLUMNS) in place, names missing from dtype are not
+# allowed, the frames should be coded together
+def code_teams(frames, dtype=None):
+    if dtype is None:
+        dtype = team_dtype([df[c] for name, df in frames.items() for c in TEAM_COLUMNS[name]])
+    for name, df in frames.items():
+        for c in TEAM_COLUMNS[name]:
+            df[c] = df[c].astype(dtype)
+    return dtype
+
+
+def memory_usage(frames):
+    return {name: int(df.memory_usage(index=False, deep=True).sum()) for name, df in frames.items()}
+
+
+def print_memory_usage(before, after):
+    for name in after:
+        print(f"{name:12} {before[name]:>14,} -> {after[name]:>14,} bytes ({1 - after[name] / before[name]:.1%} less)")
+
+
+if __name__ == "__main__":
+    from dataset import read_frame
+
+    frames = {name: read_frame(name, f"{name}.csv") for name in TEAM_COLUMNS}
+    before = memory_usage(frames)
+    code_teams(frames)
+    print_memory_usage(before, memory_usage(frames))
@@ -0,0 +1,144 @@
+import threading
+import queue
+import time
+from urllib.parse import urlparse
+from urllib.request import urlopen
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# concurrent page fetching for the crawler, workers take urls from a queue and hand back the html, they never touch
+# the Cache - pages are parsed and merged into it by the thread that consumes fetch_all()
+
+
+# spacing of requests per host instead of a fixed sleep after every page, shared by all workers of a pool unless the
+# pool is per_worker
+class RateLimiter:
+    def __init__(self, min_interval=1.0):
+        self.min_interval = min_interval
+        self._next = {}
+        self._lock = threading.Lock()
+
+    def wait(self, url):
+        host = urlparse(url).netloc
+        with self._lock:
+            now = time.monotonic()
+            at = max(now, self._next.get(host, now))
+            self._next[host] = at + self.min_interval
+        if at > now:
+            time.sleep(at - now)
+
+
+# plain GET without a browser, enough for pages that don't need JavaScript (and for a local server with saved pages)
+def fetch_static(url, timeout=30):
+    with urlopen(url, timeout=timeout) as response:
+        return response.read().decode(response.headers.get_content_charset() or "utf-8")
+
+
+HEADERS = {"User-Agent": "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/96.0",
+           "Accept-Language": "en-US,en;q=0.9"}
+
+
+# fetcher over one keep-alive session, with a store (page_store.PageStore) every page is written to it together with
+# its ETag / Last-Modified, a page that is already stored is asked for with If-None-Match / If-Modified-Since and on
+# 304 the stored copy is returned and marked as fetched now
+class HttpFetcher:
+    def __init__(self, timeout=30, pool_size=4, retries=3, store=None):
+        self.session = requests.Session()
+        self.session.headers.update(HEADERS)
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retries)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.timeout = timeout
+        self.store = store
+
+    def __call__(self, url):
+        headers = {}
+        etag, modified = (None, None) if self.store is None else self.store.validators(url)
+        if etag is not None:
+            headers["If-None-Match"] = etag
+        if modified is not None:
+            headers["If-Modified-Since"] = modified
+
+        response = self.session.get(url, headers=headers, timeout=self.timeout)
+        if response.status_code == 304 and headers:
+            self.store.touch(url)
+            return self.store.get(url)
+        response.raise_for_status()
+
+        # without a charset in the header requests falls back to latin-1, the site serves utf-8
+        if "charset" not in response.headers.get("Content-Type", ""):
+            response.encoding = "utf-8"
+        html = response.text
+        if self.store is not None:
+            self.store.put(url, html, etag=response.headers.get("ETag"), modified=response.headers.get("Last-Modified"))
+        return html
+
+    def close(self):
+        self.session.close()
+
+
+# make_fetcher is called once in every worker, a fetcher is a callable url -> html (a browser is not thread safe,
+# so every worker gets its own), fetchers with close() are closed when the worker finishes
+# the workers share limiter, so a host gets one request per min_interval whatever n_workers is, with per_worker every
+# worker keeps that spacing on its own and a host gets up to n_workers requests per min_interval
+class FetchPool:
+    def __init__(self, make_fetcher=lambda: fetch_static, n_workers=4, limiter=None, verbose=True, per_worker=False):
+        self.make_fetcher = make_fetcher
+        self.n_workers = n_workers
+        self.limiter = RateLimiter() if limiter is None else limiter
+        self.verbose = verbose
+        self.per_worker = per_worker
+
+    def _work(self, tasks, results):
+        fetcher = None
+        limiter = RateLimiter(self.limiter.min_interval) if self.per_worker else self.limiter
+        try:
+            while True:
+                url = tasks.get()
+                if url is None:
+                    return
+                try:
+                    if fetcher is None:
+                        fetcher = self.make_fetcher()
+                    limiter.wait(url)
+                    if self.verbose:
+                        print(f"visiting {url}")
+                    results.put((url, fetcher(url), None))
+                except BaseException as e:
+                    results.put((url, None, e))
+        finally:
+            if fetcher is not None and hasattr(fetcher, "close"):
+                fetcher.close()
+
+    # (url, html) in the order the pages arrive, the first failed url raises after the workers are stopped
+    def fetch_all(self, urls):
+        urls = list(dict.fromkeys(urls))
+        tasks, results = queue.Queue(), queue.Queue()
+        for url in urls:
+            tasks.put(url)
+
+        workers = [threading.Thread(target=self._work, args=(tasks, results), daemon=True)
+                   for _ in range(min(self.n_workers, len(urls)))]
+        for _ in workers:
+            tasks.put(None)
+        for worker in workers:
+            worker.start()
+
+        try:
+            for _ in range(len(urls)):
+                url, html, error = results.get()
+                if error is not None:
+                    raise error
+                yield url, html
+        finally:
+            # drop what is left so the workers stop after their current page
+            while True:
+                try:
+                    tasks.get_nowait()
+                except queue.Empty:
+                    break
+            for _ in workers:
+                tasks.put(None)
+            for worker in workers:
+                worker.join()
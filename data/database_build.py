@@ -1,23 +1,32 @@
 import pandas as pd
 import numpy as np
-from datetime import datetime
 from tqdm import tqdm
 import pickle
 import itertools
+import os
+import multiprocessing as mp
 
 from sklearn.base import BaseEstimator, TransformerMixin
 
-lineups = pd.read_csv("lineups.csv")
-events = pd.read_csv("events.csv")
-ginf = pd.read_csv('ginf.csv')
-name_to_url = pd.read_pickle('name_to_url.pkl')
-url_to_name = pd.read_pickle('url_to_name.pkl')
-valid_player_names = pd.read_pickle('valid_player_names.pkl')
+from stores import StatAccumulator, ColumnarStore, RollingHistory
+from loaders import load_events, load_lineups, load_corrections, HOME_COLUMNS, AWAY_COLUMNS
+from dataset import read_frame, read_mapping
+from codes import code_teams, memory_usage, print_memory_usage
+
+lineup_repo = load_lineups("lineups.csv")
+lineups = lineup_repo.lineups
+event_index = load_events("events.csv", load_corrections("event_corrections.csv"))
+events = event_index.events
+ginf = read_frame("ginf", 'ginf.csv')
+name_to_url = read_mapping("name_to_url", 'name_to_url.pkl')
+url_to_name = read_mapping("url_to_name", 'url_to_name.pkl')
+valid_player_names = read_mapping("valid_player_names", 'valid_player_names.pkl')
 
 labels = ["date", "home_team", "away_team"]
-lineups = lineups.drop_duplicates(subset=labels, keep='first')
-player_pos = pd.read_pickle('player_pos.pkl')
-table_pos = pd.read_pickle('table_pos.pkl')
+player_pos = read_mapping("player_pos", 'player_pos.pkl')
+table_pos = read_mapping("table_pos", 'table_pos.pkl')
+
+team_names = code_teams({"ginf": ginf, "events": events, "lineups": lineups})
 
 EVENTS_DICT = {1: "attempts(shots)",
                2: "corners",
@@ -104,18 +113,42 @@ g_cols = ["id", "name", "season", "round", "date", "team",
           "goal_conceded_away", "subs_in", "subs_out",
           "time_played", "shots_on_target", "own_goals", "days_without_injury", "has_played"]
 
-teams = pd.DataFrame(columns=t_cols)
-
-TEAM_STAT_NUMBER = len(teams.columns) - 4
-players = pd.DataFrame(columns=p_cols)
-PLAYER_STAT_NUMBER = len(players.columns) - 6
+TEAM_STAT_NUMBER = len(t_cols) - 4
+PLAYER_STAT_NUMBER = len(p_cols) - 6
+GOALKEEPER_STAT_NUMBER = len(g_cols) - 6
 
-goalkeepers = pd.DataFrame(columns=g_cols)
-GOALKEEPER_STAT_NUMBER = len(goalkeepers.columns) - 6
+teams = ColumnarStore(t_cols, ["name", "season", "round"], len(t_cols) - TEAM_STAT_NUMBER)
+players = ColumnarStore(p_cols, ["id", "season", "round"], len(p_cols) - PLAYER_STAT_NUMBER)
+goalkeepers = ColumnarStore(g_cols, ["id", "season", "round"], len(g_cols) - GOALKEEPER_STAT_NUMBER)
 
 player_round_cache = {}
 team_round_cache = {}
 
+# with the states saved by a previous run only the matches added to the end of ginf.csv since then are built and
+# transformed, removing build_state.pkl or builder_state.pkl rebuilds everything
+BUILD_STATE_PATH = "build_state.pkl"
+STATE_PATH = "builder_state.pkl"
+incremental = all(os.path.exists(path) for path in (BUILD_STATE_PATH, STATE_PATH, "X.csv"))
+
+
+# stat tables and round caches after the first n_rows rows of ginf.csv, build() continues from them
+def save_build_state(path, n_rows, last_match, tables):
+    pickle_save(path, {"n_rows": n_rows, "last_match": last_match,
+                       "teams": tables[0], "players": tables[1], "goalkeepers": tables[2],
+                       "team_round_cache": team_round_cache, "player_round_cache": player_round_cache})
+
+
+def load_build_state(path):
+    global teams, players, goalkeepers, team_round_cache, player_round_cache
+    state = pickle_load(path)
+    n_rows = state["n_rows"]
+    if n_rows > 0 and (len(ginf) < n_rows or ginf["id_odsp"].values[n_rows - 1] != state["last_match"]):
+        raise ValueError(f"ginf.csv does not continue {path} (last match {state['last_match']})")
+
+    teams, players, goalkeepers = state["teams"], state["players"], state["goalkeepers"]
+    team_round_cache, player_round_cache = state["team_round_cache"], state["player_round_cache"]
+    return n_rows
+
 
 def get_round_number(name, season):
     global team_round_cache
@@ -127,194 +160,153 @@ def get_player_round(id, season):
     return player_round_cache.get((id, season), 0) + 1
 
 
-def init_row(df, name, season, round, stat_number, id=None, date=None, team=None):
-    prev_record = [0] * stat_number
-    df.loc[len(df)] = [name, season, round, date] + prev_record if id is None else [id, name, season, round, date,
-                                                                                    team] + prev_record
+def init_row(df, name, season, round, id=None, date=None, team=None, first_xi=None):
+    if id is None:
+        df.add_row([name, season, round, date])
+    else:
+        df.add_row([id, name, season, round, date, team], tag=first_xi)
 
 
 def append_value(df, name, season, round, column, home_or_away=None, value=1, id=None, time=False):
-    if id is None:
-        df.loc[(df["name"] == name) & (df["season"] == season) & (df["round"] == round), column] += value
-    elif not time:
-        df.loc[(df["id"] == id) & (df["season"] == season) & (df["round"] == round), column] += value
+    key = (name, season, round) if id is None else (id, season, round)
+    if not time:
+        df.add(key, column, value)
+    elif df.get(key, column) == 0:
+        df.set(key, column, value)
     else:
-        row = df.loc[(df["id"] == id) & (df["season"] == season) & (df["round"] == round)]
-        if row[column].values[0] == 0:
-            df.loc[(df["id"] == id) & (df["season"] == season) & (df["round"] == round), column] = value
-        else:
-            df.loc[(df["id"] == id) & (df["season"] == season) & (df["round"] == round), column] = value - row[column]
+        df.set(key, column, value - df.get(key, column))
 
     if home_or_away is not None:
-        if id is None:
-            df.loc[((df["name"] == name) & (df["season"] == season) &
-                    (df["round"] == round)), f"{column}_{home_or_away}"] += value
-        else:
-            df.loc[((df["id"] == id) & (df["season"] == season) &
-                    (df["round"] == round)), f"{column}_{home_or_away}"] += value
+        df.add(key, f"{column}_{home_or_away}", value)
+
 
+def new_match_tables():
+    _teams = StatAccumulator(t_cols, ["name", "season", "round"], len(t_cols) - TEAM_STAT_NUMBER)
+    _players = StatAccumulator(p_cols, ["id", "season", "round"], len(p_cols) - PLAYER_STAT_NUMBER)
+    _goalkeepers = StatAccumulator(g_cols, ["id", "season", "round"], len(g_cols) - GOALKEEPER_STAT_NUMBER)
+    return _teams, _players, _goalkeepers
 
-def init_players_in_match(lineup, season, date, _goalkeepers, _players):
+
+def player_rounds_in_match(lineup, season):
     rounds = {}
-    for nr, team in list(itertools.product([i for i in range(1, 13)], ["ap", "hp", "hs", "as"])):
-        pl = team + str(nr)
-        if nr == 12 and (team == "ap" or team == "hp"):
-            pass
-        elif not isnull(lineup[pl]):
-            team_name = "home_team" if team[0] == "h" else "away_team"
-            pl_id = name_to_url[(lineup[pl].values[0], season, lineup[team_name].values[0])]
-            pl_role = player_pos[pl_id]
-            (db, stats) = (_goalkeepers, GOALKEEPER_STAT_NUMBER) if pl_role == "Goalkeeper" else (
-                _players, PLAYER_STAT_NUMBER)
-            if pl_role == "Goalkeeper":
-                rnd = get_player_round(pl_id, season)
-            else:
-                rnd = get_player_round(pl_id, season)
-            rounds[(lineup[pl].values[0], season, lineup[team_name].values[0])] = rnd
-            init_row(db, lineup[pl].values[0], season, rnd, stats, pl_id, date, lineup[team_name].values[0])
+    for p in HOME_COLUMNS + AWAY_COLUMNS:
+        if not isnull(lineup[p]):
+            team = lineup["home_team"] if p[0] == "h" else lineup["away_team"]
+            rounds[(lineup[p], season, team)] = get_player_round(name_to_url[(lineup[p], season, team)], season)
     return rounds
 
 
-def update_time_played(lineup, season, rounds, _goalkeepers, _players):
-    for nr, team in list(itertools.product([i for i in range(1, 13)], ["ap", "hp", "hs", "as"])):
-        pl = team + str(nr)
-        if nr == 12 and (team == "ap" or team == "hp"):
-            pass
-        elif not isnull(lineup[pl]):
-            team_name = "home_team" if team[0] == "h" else "away_team"
+def remember_rounds(lineup, season, rounds):
+    global player_round_cache
+    for p in HOME_COLUMNS + AWAY_COLUMNS:
+        if not isnull(lineup[p]):
+            team = lineup["home_team"] if p[0] == "h" else lineup["away_team"]
+            pl_id = name_to_url[(lineup[p], season, team)]
+            player_round_cache[(pl_id, season)] = rounds[(lineup[p], season, team)]
+
 
-            pl_id = name_to_url[(lineup[pl].values[0], season, lineup[team_name].values[0])]
-            pl_role = player_pos[pl_id]
-            pl_round = rounds[(lineup[pl].values[0], season, lineup[team_name].values[0])]
-            db = _goalkeepers if pl_role == "Goalkeeper" else _players
-            row = db.loc[(db["id"] == pl_id) & (db["season"] == season) & (db["round"] == pl_round)]
-            if len(row) > 0:
-                # zabezpieczenie co do tych którzy zeszli z boiska za kartki
-                if row["subs_out"].values[0] != 0 and (
-                        row["second_yellow_card"].values[0] == 1 or row["straight_red_card"].values[0] == 1):
-                    db.loc[(db["id"] == pl_id) & (db["season"] == season) & (db["round"] == pl_round), "subs_out"] = 0
-
-                if row["subs_in"].values[0] == 0 and row["subs_out"].values[0] == 0 and team[1] == "p":
-                    db.loc[
-                        (db["id"] == pl_id) & (db["season"] == season) & (db["round"] == pl_round), "time_played"] = 90
-                elif row["subs_in"].values[0] != 0 and row["subs_out"].values[0] == 0:
-                    db.loc[(db["id"] == pl_id) & (db["season"] == season) & (
-                            db["round"] == pl_round), "time_played"] = 90 - row["time_played"]
-
-                if db.loc[(db["id"] == pl_id) & (db["season"] == season) &
-                          (db["round"] == pl_round), "time_played"].values[0] != 0:
-                    db.loc[(db["id"] == pl_id) & (db["season"] == season) & (db["round"] == pl_round), "has_played"] = 1
-
-
-def count_days(date1, date2):
-    year1, month1, day1 = date1[0:4], date1[5:7], date1[8:]
-    year2, month2, day2 = date2[0:4], date2[5:7], date2[8:]
-    d1 = datetime(int(year1), int(month1), int(day1))
-    d2 = datetime(int(year2), int(month2), int(day2))
-    return (d2 - d1).days
-
-
-def update_injuries(lineup, season, rounds, _goalkeepers, _players):
+def init_players_in_match(lineup, season, date, rounds, _goalkeepers, _players):
     for nr, team in list(itertools.product([i for i in range(1, 13)], ["ap", "hp", "hs", "as"])):
         pl = team + str(nr)
         if nr == 12 and (team == "ap" or team == "hp"):
             pass
         elif not isnull(lineup[pl]):
             team_name = "home_team" if team[0] == "h" else "away_team"
-
-            pl_id = name_to_url[(lineup[pl].values[0], season, lineup[team_name].values[0])]
-            pl_role = player_pos[pl_id]
-            pl_round = rounds[(lineup[pl].values[0], season, lineup[team_name].values[0])]
-            db = _goalkeepers if pl_role == "Goalkeeper" else _players
-            row = db.loc[(db["id"] == pl_id) & (db["season"] == season) & (db["round"] == pl_round)]
-            if len(row) > 0:
-                if row["has_injured"].values[0] == 1:
-                    # row["days_without_injury"] = 0
-                    db.loc[(db["id"] == pl_id) & (db["season"] == season) & (
-                            db["round"] == pl_round), "days_without_injury"] = 0
-                else:
-                    if pl_round == 1:
-                        # row["days_without_inury"] = 10000
-                        db.loc[(db["id"] == pl_id) & (db["season"] == season) & (
-                                db["round"] == pl_round), "days_without_injury"] = 10000
-                        # print("ustawione")
-                    else:
-                        if pl_role == "Goalkeeper":
-                            prev = goalkeepers.loc[(goalkeepers["id"] == pl_id) & (goalkeepers["season"] == season) & (
-                                    goalkeepers["round"] == pl_round - 1)]
-                        else:
-                            prev = players.loc[(players["id"] == pl_id) & (players["season"] == season) & (
-                                    players["round"] == pl_round - 1)]
-                        if prev["days_without_injury"].values[0] == 10000:
-                            db.loc[(db["id"] == pl_id) & (db["season"] == season) & (
-                                    db["round"] == pl_round), "days_without_injury"] = 10000
-                        else:
-                            days = count_days(prev["date"].values[0], row["date"].values[0])
-                            db.loc[(db["id"] == pl_id) & (db["season"] == season) & (
-                                    db["round"] == pl_round), "days_without_injury"] = \
-                                prev["days_without_injury"].values[0] + days
+            pl_id = name_to_url[(lineup[pl], season, lineup[team_name])]
+            db = _goalkeepers if player_pos[pl_id] == "Goalkeeper" else _players
+            rnd = rounds[(lineup[pl], season, lineup[team_name])]
+            init_row(db, lineup[pl], season, rnd, pl_id, date, lineup[team_name], first_xi=team[1] == "p")
+
+
+# 90 minute rules for every row of a player or goalkeeper table at once, first_xi is the tag of the row,
+# rows repeated under one key (one player in two lineup slots) share their values and apply the rules again in the order
+# of their slots, like the loop over the lineup did
+def resolve_time_played(df, first_xi):
+    keys = ["id", "season", "round"]
+    group = df.groupby(keys, sort=False).ngroup().values
+    occurrence = df.groupby(keys, sort=False).cumcount().values
+    first_xi = first_xi.astype(bool)
+
+    first = np.flatnonzero(occurrence == 0)
+    state = {c: np.zeros(len(first), dtype=np.int64) for c in ["subs_in", "subs_out", "time_played", "has_played"]}
+    for c in state:
+        state[c][group[first]] = df[c].values[first]
+    carded = np.zeros(len(first), dtype=bool)
+    carded[group[first]] = (df["second_yellow_card"].values[first] == 1) | (df["straight_red_card"].values[first] == 1)
+
+    for level in range(occurrence.max() + 1 if len(df) > 0 else 0):
+        rows = np.flatnonzero(occurrence == level)
+        g = group[rows]
+        # subs_in, subs_out and time_played are read before subs_out is reset for the players sent off
+        subs_in, subs_out, time_played = state["subs_in"][g], state["subs_out"][g], state["time_played"][g]
+
+        # zabezpieczenie co do tych którzy zeszli z boiska za kartki
+        state["subs_out"][g[(subs_out != 0) & carded[g]]] = 0
+
+        full_game = (subs_in == 0) & (subs_out == 0) & first_xi[rows]
+        came_in = (subs_in != 0) & (subs_out == 0)
+        state["time_played"][g[full_game]] = 90
+        state["time_played"][g[came_in]] = 90 - time_played[came_in]
+
+        state["has_played"][g[state["time_played"][g] != 0]] = 1
+
+    for c in state:
+        df[c] = state[c][group]
+    return df
+
+
+# days since the last round (of the player in the season) with has_injured, 0 in that round, 10000 until
+# the first injury - the chain that used to be carried from the previous round, computed for the whole table at once
+def resolve_days_without_injury(df):
+    keys = ["id", "season", "round"]
+    # rows repeated under one key took the values of the first of them
+    first = df.drop_duplicates(keys).sort_values(keys)
+    dates = pd.to_datetime(first["date"])
+    injured_at = dates.where(first["has_injured"] == 1).groupby([first["id"], first["season"]]).ffill()
+    days = (dates - injured_at).dt.days.fillna(10000).astype(np.int64)
+
+    days = pd.Series(days.values, index=pd.MultiIndex.from_frame(first[keys]))
+    df["days_without_injury"] = days.reindex(pd.MultiIndex.from_frame(df[keys])).values
+    return df
 
 
 def keeper_update(season, rounds, team, lineup, _goalkeepers, saved=False, goal_con=False):
-    l_team = "h" if team == lineup["home_team"].values[0] else "a"
-    st_keeper_id = name_to_url[(lineup[l_team + "p1"].values[0], season, team)]
-    st_keeper_round = rounds[(lineup[l_team + "p1"].values[0], season, team)]
-    starting_keeper = _goalkeepers.loc[
-        (_goalkeepers["id"] == st_keeper_id) & (_goalkeepers["round"] == st_keeper_round) & (
-                _goalkeepers["season"] == season)]
-    if starting_keeper["subs_out"].values[0] == 0:
+    l_team = "h" if team == lineup["home_team"] else "a"
+    st_keeper_id = name_to_url[(lineup[l_team + "p1"], season, team)]
+    st_keeper_round = rounds[(lineup[l_team + "p1"], season, team)]
+    if _goalkeepers.get((st_keeper_id, season, st_keeper_round), "subs_out") == 0:
         if goal_con:
             hoa = "home" if l_team == "h" else "away"
-            append_value(_goalkeepers, lineup[l_team + "p1"].values[0], season, st_keeper_round, "goal_conceded",
+            append_value(_goalkeepers, lineup[l_team + "p1"], season, st_keeper_round, "goal_conceded",
                          home_or_away=hoa, id=st_keeper_id)
-            append_value(_goalkeepers, lineup[l_team + "p1"].values[0], season, st_keeper_round, "shots_on_target",
+            append_value(_goalkeepers, lineup[l_team + "p1"], season, st_keeper_round, "shots_on_target",
                          id=st_keeper_id)
         if saved:
-            append_value(_goalkeepers, lineup[l_team + "p1"].values[0], season, st_keeper_round, "shots_saved",
+            append_value(_goalkeepers, lineup[l_team + "p1"], season, st_keeper_round, "shots_saved",
                          id=st_keeper_id)
-            append_value(_goalkeepers, lineup[l_team + "p1"].values[0], season, st_keeper_round, "shots_on_target",
+            append_value(_goalkeepers, lineup[l_team + "p1"], season, st_keeper_round, "shots_on_target",
                          id=st_keeper_id)
     else:
         for i in range(1, 13):
             pl = l_team + "s" + str(i)
-            if isnull(lineup[pl].values[0]):
+            if isnull(lineup[pl]):
                 return
 
-            if (lineup[pl].values[0], season, team) in name_to_url:
-                # print(lineup[pl].values[0], season, team, pl)
-                pl_id = name_to_url[(lineup[pl].values[0], season, team)]
+            if (lineup[pl], season, team) in name_to_url:
+                # print(lineup[pl], season, team, pl)
+                pl_id = name_to_url[(lineup[pl], season, team)]
             if player_pos[pl_id] == "Goalkeeper":
-                pl_round = rounds[(lineup[pl].values[0], season, team)]
-                gk = _goalkeepers.loc[(_goalkeepers["id"] == pl_id) & (_goalkeepers["season"] == season) & (
-                        _goalkeepers["round"] == pl_round)]
-                if gk["subs_in"].values[0] != 0 and gk["subs_out"].values[0] == 0:
+                pl_round = rounds[(lineup[pl], season, team)]
+                gk = (pl_id, season, pl_round)
+                if _goalkeepers.get(gk, "subs_in") != 0 and _goalkeepers.get(gk, "subs_out") == 0:
                     if goal_con:
                         hoa = "home" if l_team == "h" else "away"
-                        append_value(_goalkeepers, lineup[pl].values[0], season, pl_round, "goal_conceded",
+                        append_value(_goalkeepers, lineup[pl], season, pl_round, "goal_conceded",
                                      home_or_away=hoa, id=pl_id)
-                        append_value(_goalkeepers, lineup[pl].values[0], season, pl_round, "shots_on_target", id=pl_id)
+                        append_value(_goalkeepers, lineup[pl], season, pl_round, "shots_on_target", id=pl_id)
                     if saved:
-                        append_value(_goalkeepers, lineup[pl].values[0], season, pl_round, "shots_saved", id=pl_id)
-                        append_value(_goalkeepers, lineup[pl].values[0], season, pl_round, "shots_on_target", id=pl_id)
-
-
-def postprocess(lineup, season, rounds, _goalkeepers, _players, _teams):
-    global players
-    global teams
-    global goalkeepers
-    global player_round_cache
-    update_time_played(lineup, season, rounds, _goalkeepers, _players)
-    update_injuries(lineup, season, rounds, _goalkeepers, _players)
-    players = pd.concat([players, _players])
-    teams = pd.concat([teams, _teams])
-    goalkeepers = pd.concat([goalkeepers, _goalkeepers])
-    pls = [f"hp{i}" for i in range(1, 12)] + [f"hs{i}" for i in range(1, 13)] + [f"ap{i}" for i in range(1, 12)] + [
-        f"as{i}" for i in range(1, 13)]
-    for p in pls:
-        if not isnull(lineup[p].values[0]):
-            team = lineup["home_team"].values[0] if p[0] == "h" else lineup["away_team"].values[0]
-            pl_id = name_to_url[(lineup[p].values[0], season, team)]
-            player_round_cache[(pl_id, season)] = rounds[(lineup[p].values[0], season, team)]
+                        append_value(_goalkeepers, lineup[pl], season, pl_round, "shots_saved", id=pl_id)
+                        append_value(_goalkeepers, lineup[pl], season, pl_round, "shots_on_target", id=pl_id)
 
 
 def find_name(pl, team, other_team, lineup, other_lineup, season):
@@ -331,35 +323,149 @@ def find_name(pl, team, other_team, lineup, other_lineup, season):
     raise TypeError(f"={valid_player_names.get((pl, team, season), pl)}= ={name}= ={pl}= {season}")
 
 
-def team_stats(match_id, season, home_team, away_team, date):
-    evs = events.loc[events["id_odsp"] == match_id, :]
-
-    _teams = pd.DataFrame(columns=t_cols)
-    _players = pd.DataFrame(columns=p_cols)
-    _goalkeepers = pd.DataFrame(columns=g_cols)
-
-    hm_round = get_round_number(home_team, season)
-    init_row(_teams, home_team, season, hm_round, TEAM_STAT_NUMBER, date=date)
-    aw_round = get_round_number(away_team, season)
-    init_row(_teams, away_team, season, aw_round, TEAM_STAT_NUMBER, date=date)
-
-    lineup = lineups.loc[
-        (lineups["date"] == date) & (lineups["home_team"] == home_team) & (lineups["away_team"] == away_team)]
-    player_rounds = init_players_in_match(lineup, season, date, _goalkeepers, _players)
-
-    home_lineup = lineup[[f"hp{i}" for i in range(1, 12)] + [f"hs{i}" for i in range(1, 13)]].values[0]
-    away_lineup = lineup[[f"ap{i}" for i in range(1, 12)] + [f"as{i}" for i in range(1, 13)]].values[0]
+def lineup_members(matches):
+    # (id_odsp, is_home, player) for every player named in the lineups of the given matches
+    match_lineups = matches.merge(lineups, left_on=["date", "ht", "at"],
+                                  right_on=["date", "home_team", "away_team"])
+    members = []
+    for is_home, cols in ((True, HOME_COLUMNS), (False, AWAY_COLUMNS)):
+        long = match_lineups.melt(id_vars=["id_odsp"], value_vars=cols, value_name="player").dropna(subset=["player"])
+        members.append(pd.DataFrame({"id_odsp": long["id_odsp"].values, "is_home": is_home,
+                                     "player": long["player"].values}))
+    return pd.MultiIndex.from_frame(pd.concat(members))
+
+
+def name_translation():
+    # valid_player_names as a table, (player, team, season) -> name
+    return pd.DataFrame([key + (name,) for key, name in valid_player_names.items()],
+                        columns=["player", "team", "season", "name"]).astype({"season": ginf["season"].dtype})
+
+
+def in_lineup(evs, column, is_home, members, translation):
+    team = evs["ht"] if is_home else evs["at"]
+    keys = pd.DataFrame({"player": evs[column].values, "team": team.values, "season": evs["season"].values})
+    # names without a translation stay as they are, like valid_player_names.get(key, player)
+    names = keys.merge(translation, on=["player", "team", "season"], how="left")["name"]
+    names = names.where(names.notnull(), keys["player"]).values
+    return pd.MultiIndex.from_arrays([evs["id_odsp"].values, np.full(len(evs), is_home), names]).isin(members)
+
+
+def resolve_event_sides(evs, members):
+    # side of the team that the event loop of match_stats ends up crediting, following its find_name calls:
+    # a player found only in the other lineup moves the event to the other team
+    ev_home = (evs["event_team"] == evs["ht"]).values
+    switched = ((evs["event_type"] == 2) | (evs["event_type2"] == 15)).values
+    not_corner = (evs["event_type"] != 2).values
+    translation = name_translation()
+
+    for column, applies in (("player", True), ("player2", not_corner), ("player_in", True), ("player_out", True)):
+        in_home = in_lineup(evs, column, True, members, translation)
+        in_away = in_lineup(evs, column, False, members, translation)
+        # player of own goals and corners is looked up in the opponent's lineup first
+        look_home = ev_home ^ switched if column == "player" else ev_home
+        found_home = np.where(look_home, in_home | ~in_away, in_home & ~in_away)
+        if column == "player":
+            found_home = found_home ^ switched
+        ev_home = np.where(evs[column].notnull().values & applies, found_home, ev_home)
+
+    return ev_home
+
+
+def count_team_events(start_at=0):
+    # team counters of every match from start_at computed at once, keyed by (id_odsp, is_home, crossed),
+    # crossed counters are the ones that match_stats credits with the round of the other team
+    matches = ginf.loc[start_at:]
+    matches = matches.loc[matches["adv_stats"].astype(bool), ["id_odsp", "date", "ht", "at", "season"]]
+    evs = events.merge(matches, on="id_odsp")
+
+    origin_home = (evs["event_team"] == evs["ht"]).values
+    final_home = resolve_event_sides(evs, lineup_members(matches))
+    crossed = origin_home != final_home
+    ev_hoa = np.where(origin_home, "home", "away").astype(object)
+    op_hoa = np.where(origin_home, "away", "home").astype(object)
+
+    ev_type, ev_type2 = evs["event_type"].values, evs["event_type2"].values
+    goal = evs["is_goal"].values == 1
+    attempt = ev_type == 1
+    located = (evs["location"].notnull() & (evs["location"] != 19)).values
+    location = evs["location"].map(LOCATIONS_DICT)
+    with_situation = evs["situation"].notnull().values
+    situation = evs["situation"].map(SITUATIONS_DICT)
+
+    credits = []
+
+    def credit(mask, column, to_event_team=True):
+        column = np.broadcast_to(np.asarray(column, dtype=object), mask.shape)
+        target = final_home if to_event_team else ~final_home
+        credits.append(pd.DataFrame({"id_odsp": evs["id_odsp"].values[mask], "is_home": target[mask],
+                                     "crossed": crossed[mask], "column": column[mask]}))
+
+    credit(goal, "goal_scored")
+    credit(goal, "goal_scored_" + ev_hoa)
+    credit(goal, "goal_conceded", False)
+    credit(goal, "goal_conceded_" + op_hoa, False)
+    credit(goal & (ev_type2 == 15), EVENTS_DICT[15], False)
+    for shot in (goal, attempt):
+        credit(shot, EVENTS_DICT[1])
+        credit(shot & located, "shot_made_" + location)
+        credit(shot & located, "shot_conceded_" + location, False)
+        credit(shot & with_situation, situation + "_made")
+        credit(shot & with_situation, situation + "_conceded", False)
+    credit(attempt & (evs["shot_outcome"].values == 1), "shots_on_target")
+    credit(ev_type == 2, EVENTS_DICT[2] + "_won")
+    credit(ev_type == 2, EVENTS_DICT[2] + "_conceded", False)
+    credit(ev_type == 3, EVENTS_DICT[3])
+    credit((ev_type == 4) | (ev_type == 5), EVENTS_DICT[4])
+    credit((ev_type == 5) | (ev_type == 6), "red_cards")
+    credit(ev_type == 7, EVENTS_DICT[7])
+    credit(ev_type == 8, EVENTS_DICT[8] + "_won")
+    credit(ev_type == 8, EVENTS_DICT[8] + "_conceded", False)
+    credit(ev_type == 9, EVENTS_DICT[9])
+    credit(ev_type == 11, EVENTS_DICT[11] + "_conceded")
+    credit(ev_type == 11, EVENTS_DICT[11] + "_won", False)
+
+    counts = pd.concat(credits).groupby(["id_odsp", "is_home", "crossed", "column"]).size()
+    counts = counts.unstack("column", fill_value=0).reindex(columns=t_cols[4:], fill_value=0)
+    return dict(zip(counts.index, counts.values.astype(np.int64)))
+
+
+built_rows = load_build_state(BUILD_STATE_PATH) if incremental else 0
+team_counters = count_team_events(built_rows)
+
+
+def add_team_counters(_teams, match_id, season, home_team, away_team, hm_round, aw_round):
+    # crossed counters were appended with the round of the other team, so they only land when both rounds are equal
+    for crossed in ((False, True) if hm_round == aw_round else (False,)):
+        for is_home, team, rnd in ((True, home_team, hm_round), (False, away_team, aw_round)):
+            counts = team_counters.get((match_id, is_home, crossed))
+            if counts is not None:
+                _teams.add_values((team, season, rnd), counts)
+
+
+# stat rows of a single match, depends only on the rounds given to it, so matches can be computed in any order
+def match_stats(match_id, season, home_team, away_team, date, hm_round, aw_round, player_rounds):
+    evs = event_index.match(match_id)
+
+    _teams, _players, _goalkeepers = new_match_tables()
+
+    init_row(_teams, home_team, season, hm_round, date=date)
+    init_row(_teams, away_team, season, aw_round, date=date)
+
+    lineup_pos = lineup_repo.find(date, home_team, away_team)
+    lineup = lineup_repo.row(lineup_pos)
+    init_players_in_match(lineup, season, date, player_rounds, _goalkeepers, _players)
+
+    home_lineup = lineup_repo.home_players(lineup_pos)
+    away_lineup = lineup_repo.away_players(lineup_pos)
 
     append_value(_teams, home_team, season, hm_round, "games_played", "home")
     append_value(_teams, away_team, season, aw_round, "games_played", "away")
+    add_team_counters(_teams, match_id, season, home_team, away_team, hm_round, aw_round)
 
     for _, ev in evs.iterrows():
         # print("-----------------new ev---------------------")
         ev_team, op_team = ev["event_team"], ev["opponent"]
         ev_home_or_away = "home" if home_team == ev_team else "away"
-        ev_round = hm_round if home_team == ev_team else aw_round
-        op_home_or_away = "away" if home_team == ev_team else "home"
-        op_round = aw_round if home_team == ev_team else hm_round
 
         if ev_home_or_away == "home":
             ev_lineup, op_lineup = home_lineup, away_lineup
@@ -446,25 +552,12 @@ def team_stats(match_id, season, home_team, away_team, date):
         else:
             evapp2 = False
 
-        # goal scored
+        # goal scored, team counters come from count_team_events
         if ev['is_goal'] == 1:
-            append_value(_teams, ev_team, season, ev_round, "goal_scored", ev_home_or_away)
-            append_value(_teams, op_team, season, op_round, "goal_conceded", op_home_or_away)
-            append_value(_teams, ev_team, season, ev_round, EVENTS_DICT[1])
-            if not isnull(ev['location']) and ev['location'] != 19:
-                append_value(_teams, ev_team, season, ev_round, "shot_made_" + LOCATIONS_DICT[ev['location']])
-                append_value(_teams, op_team, season, op_round, "shot_conceded_" + LOCATIONS_DICT[ev['location']])
-
-            if not isnull(ev['situation']):
-                append_value(_teams, ev_team, season, ev_round, SITUATIONS_DICT[ev['situation']] + "_made")
-                append_value(_teams, op_team, season, op_round, SITUATIONS_DICT[ev['situation']] + "_conceded")
-
             keeper_update(season, player_rounds, op_team, lineup, _goalkeepers, goal_con=True)
 
             # own goal
             if ev['event_type2'] == 15:
-                # adding to team
-                append_value(_teams, op_team, season, op_round, EVENTS_DICT[15])
                 # adding to player
                 if player_pos[ev_pl_id] != "Goalkeeper":
                     append_value(db, ev_pl_name, season, ev_pl_round, EVENTS_DICT[15], id=ev_pl_id)
@@ -489,22 +582,8 @@ def team_stats(match_id, season, home_team, away_team, date):
             if player_pos[ev_pl_id] != "Goalkeeper":
                 append_value(db, ev_pl_name, season, ev_pl_round, EVENTS_DICT[1], id=ev_pl_id)
 
-            # attempts(shots)
-            append_value(_teams, ev_team, season, ev_round, EVENTS_DICT[1])
-
-            # shot at given location
-            if not isnull(ev['location']) and ev['location'] != 19:
-                append_value(_teams, ev_team, season, ev_round, "shot_made_" + LOCATIONS_DICT[ev['location']])
-                append_value(_teams, op_team, season, op_round, "shot_conceded_" + LOCATIONS_DICT[ev['location']])
-
-            if not isnull(ev['situation']):
-                append_value(_teams, ev_team, season, ev_round, SITUATIONS_DICT[ev['situation']] + "_made")
-                append_value(_teams, op_team, season, op_round, SITUATIONS_DICT[ev['situation']] + "_conceded")
-
                 # shot on target
             if ev['shot_outcome'] == 1:
-                # team
-                append_value(_teams, ev_team, season, ev_round, "shots_on_target")
                 # player
                 if player_pos[ev_pl_id] != "Goalkeeper":
                     append_value(db, ev_pl_name, season, ev_pl_round, "shots_on_target", id=ev_pl_id)
@@ -517,27 +596,20 @@ def team_stats(match_id, season, home_team, away_team, date):
 
         # corner
         elif ev['event_type'] == 2:
-            # teams
-            append_value(_teams, ev_team, season, ev_round, EVENTS_DICT[2] + "_won")
-            append_value(_teams, op_team, season, op_round, EVENTS_DICT[2] + "_conceded")
             # player corners conceded ++
             if player_pos[ev_pl_id] != "Goalkeeper":
                 append_value(db, ev_pl_name, season, ev_pl_round, EVENTS_DICT[2] + "_conceded", id=ev_pl_id)
 
         # fouls
         elif ev['event_type'] == 3:
-            append_value(_teams, ev_team, season, ev_round, EVENTS_DICT[3])
             # player fouls++
             append_value(db, ev_pl_name, season, ev_pl_round, EVENTS_DICT[3], id=ev_pl_id)
         # yellow card
         elif ev['event_type'] == 4:
-            append_value(_teams, ev_team, season, ev_round, EVENTS_DICT[4])
             # player yellow card++
             append_value(db, ev_pl_name, season, ev_pl_round, EVENTS_DICT[4], id=ev_pl_id)
         # second yellow card
         elif ev['event_type'] == 5:
-            append_value(_teams, ev_team, season, ev_round, EVENTS_DICT[4])
-            append_value(_teams, ev_team, season, ev_round, "red_cards")
             # player second yellow++
             append_value(db, ev_pl_name, season, ev_pl_round, EVENTS_DICT[5], id=ev_pl_id)
             append_value(db, ev_pl_name, season, ev_pl_round, "subs_out", id=ev_pl_id)
@@ -545,7 +617,6 @@ def team_stats(match_id, season, home_team, away_team, date):
 
         # red card
         elif ev['event_type'] == 6:
-            append_value(_teams, ev_team, season, ev_round, "red_cards")
             # player red++
             append_value(db, ev_pl_name, season, ev_pl_round, EVENTS_DICT[6], id=ev_pl_id)
             append_value(db, ev_pl_name, season, ev_pl_round, "subs_out", id=ev_pl_id)
@@ -553,7 +624,6 @@ def team_stats(match_id, season, home_team, away_team, date):
 
         # substitution
         elif ev['event_type'] == 7:
-            append_value(_teams, ev_team, season, ev_round, EVENTS_DICT[7])
             # player substitution += minutes
             # player in
             # print(ev["id_event"])
@@ -570,15 +640,12 @@ def team_stats(match_id, season, home_team, away_team, date):
 
         # free kick won
         elif ev['event_type'] == 8:
-            append_value(_teams, ev_team, season, ev_round, EVENTS_DICT[8] + "_won")
-            append_value(_teams, op_team, season, op_round, EVENTS_DICT[8] + "_conceded")
             # player free kicks won++
             if player_pos[ev_pl_id] != "Goalkeeper":
                 append_value(db, ev_pl_name, season, ev_pl_round, EVENTS_DICT[8] + "_won", id=ev_pl_id)
 
         # offside
         elif ev['event_type'] == 9:
-            append_value(_teams, ev_team, season, ev_round, EVENTS_DICT[9])
             # player offsides ++
             if player_pos[ev_pl_id] != "Goalkeeper":
                 # print("\n"+player_pos[ev_pl_id] + " | " + ev_pl_id)
@@ -589,25 +656,54 @@ def team_stats(match_id, season, home_team, away_team, date):
             # player hand ball ++
             if player_pos[ev_pl_id] != "Goalkeeper":
                 append_value(db, ev_pl_name, season, ev_pl_round, EVENTS_DICT[10], id=ev_pl_id)
-        # penalty
-        elif ev['event_type'] == 11:
-            append_value(_teams, ev_team, season, ev_round, EVENTS_DICT[11] + "_conceded")
-            append_value(_teams, op_team, season, op_round, EVENTS_DICT[11] + "_won")
 
-    postprocess(lineup, season, player_rounds, _goalkeepers, _players, _teams)
-    team_round_cache[(home_team, season)] = hm_round
-    team_round_cache[(away_team, season)] = aw_round
+    return _teams, _players, _goalkeepers
 
 
-def build(start_at=0):
-    for ind, row in tqdm(ginf.loc[start_at:].iterrows(), total=len(ginf) - start_at):
-        if row["adv_stats"]:
-            try:
-                id_if_error = row["id_odsp"]
-                team_stats(row["id_odsp"], row["season"], row["ht"], row["at"], row["date"])
-            except BaseException as e:
-                print(f"iters: {start_at}, id_if_error: {id_if_error}")
-                raise e
+# first pass - rounds of the teams and the players are the only thing carried from one match to the next
+def assign_rounds(matches):
+    global team_round_cache
+    jobs = []
+    for match_id, season, home_team, away_team, date in zip(matches["id_odsp"], matches["season"], matches["ht"],
+                                                            matches["at"], matches["date"]):
+        hm_round = get_round_number(home_team, season)
+        aw_round = get_round_number(away_team, season)
+        lineup = lineup_repo.row(lineup_repo.find(date, home_team, away_team))
+        player_rounds = player_rounds_in_match(lineup, season)
+
+        remember_rounds(lineup, season, player_rounds)
+        team_round_cache[(home_team, season)] = hm_round
+        team_round_cache[(away_team, season)] = aw_round
+        jobs.append((match_id, season, home_team, away_team, date, hm_round, aw_round, player_rounds))
+    return jobs
+
+
+def run_match_stats(job):
+    try:
+        return match_stats(*job)
+    except BaseException as e:
+        print(f"id_if_error: {job[0]}")
+        raise e
+
+
+# second pass - matches are computed in forked worker processes when n_jobs > 1 and appended in ginf order,
+# time_played and days_without_injury are resolved afterwards for whole tables
+def build(start_at=0, n_jobs=1):
+    matches = ginf.loc[start_at:]
+    jobs = assign_rounds(matches.loc[matches["adv_stats"].astype(bool)])
+
+    if n_jobs > 1 and "fork" in mp.get_all_start_methods():
+        with mp.get_context("fork").Pool(n_jobs) as pool:
+            for _teams, _players, _goalkeepers in tqdm(pool.imap(run_match_stats, jobs, chunksize=16),
+                                                       total=len(jobs)):
+                teams.extend(_teams)
+                players.extend(_players)
+                goalkeepers.extend(_goalkeepers)
+    else:
+        for _teams, _players, _goalkeepers in tqdm(map(run_match_stats, jobs), total=len(jobs)):
+            teams.extend(_teams)
+            players.extend(_players)
+            goalkeepers.extend(_goalkeepers)
 
 
 def fix_mistakes():
@@ -662,24 +758,100 @@ def fix_mistakes():
             lineups["season"] == 2013), "hp2"] = "pablo valeira alvarez"
     lineups.loc[(lineups["home_team"] == "AS Roma") & (lineups["away_team"] == "Parma") & (
             lineups["season"] == 2014), "hp5"] = "vassilis torosidis"
-
-
-build()
+    lineup_repo.refresh()
+
+
+build(start_at=built_rows, n_jobs=os.cpu_count())
+# build() goes through every row of ginf.csv, fix_mistakes drops some of them later, the tables are saved with the
+# state of the builder at the end of the run
+built_tables = teams, players, goalkeepers
+built_watermark = len(ginf), ginf["id_odsp"].values[-1] if len(ginf) else None
+players_first_xi, goalkeepers_first_xi = players.tags(), goalkeepers.tags()
+teams, players, goalkeepers = teams.to_frame(), players.to_frame(), goalkeepers.to_frame()
+players = resolve_days_without_injury(resolve_time_played(players, players_first_xi))
+goalkeepers = resolve_days_without_injury(resolve_time_played(goalkeepers, goalkeepers_first_xi))
 fix_mistakes()
 
+# team columns share the categories of ginf, events and lineups, player ids and names get their own
+tables = {"teams": teams, "players": players, "goalkeepers": goalkeepers}
+tables_usage = memory_usage(tables)
+teams["name"] = teams["name"].astype(team_names)
+for df in (players, goalkeepers):
+    df["team"] = df["team"].astype(team_names)
+    df["id"], df["name"] = df["id"].astype("category"), df["name"].astype("category")
+print_memory_usage(tables_usage, memory_usage(tables))
+
 
 # group_by_position - bool
 # n_games - None or int
 # exact_results - bool
 # n_splits - [2, ...]
 class DatabaseBuilder(BaseEstimator, TransformerMixin):
-    def __init__(self, n_games=None, exact_results=False):
+    def __init__(self, n_games=None, exact_results=False, n_jobs=1):
         self.n_games = n_games
         self.exact_results = exact_results
+        self.n_jobs = n_jobs
 
         self._team_history = {}
         self._player_history = {}
 
+        # watermark - rows of ginf.csv up to the last match transformed and id_odsp of that match, taken from the
+        # index of ginf after fix_mistakes so they don't depend on the rows it drops,
+        # rows of ginf.csv of the rows of X.csv and the offsets of those in the file (the last one is its size)
+        self._n_matches = 0
+        self._last_match = None
+        self._rows = np.zeros(0, dtype=np.int64)
+        self._offsets = None
+
+    def save_state(self, path):
+        pickle_save(path, {"n_games": self.n_games, "exact_results": self.exact_results,
+                           "team_history": self._team_history, "player_history": self._player_history,
+                           "n_matches": self._n_matches, "last_match": self._last_match, "rows": self._rows,
+                           "offsets": self._offsets})
+
+    def load_state(self, path):
+        state = pickle_load(path)
+        if "offsets" not in state or any(isinstance(history, list) for history in state["team_history"].values()):
+            raise ValueError(f"{path} was saved before histories kept running totals, remove it to rebuild X.csv")
+        if state["n_games"] != self.n_games or state["exact_results"] != self.exact_results:
+            raise ValueError(f"{path} was saved with n_games={state['n_games']}, "
+                             f"exact_results={state['exact_results']}")
+
+        self._team_history = state["team_history"]
+        self._player_history = state["player_history"]
+        self._n_matches = state["n_matches"]
+        self._last_match = state["last_match"]
+        self._rows = state["rows"]
+        self._offsets = state["offsets"]
+        return self
+
+    # writes X from transform into X.csv, the file is kept up to the first row that changed and truncated there,
+    # rows after it that stay are copied from the rest of the file as they are
+    def write_features(self, path, X):
+        lines = X.to_csv(index=False, header=False).encode().splitlines(keepends=True)
+        n_kept = int(self.kept_.sum())
+        n_old = min(len(self.kept_), len(self.order_))
+        changed = np.flatnonzero(~self.kept_[:n_old] | (self.order_[:n_old] != np.arange(n_old)))
+        first = changed[0] if len(changed) else n_old
+
+        if self._offsets is None:
+            with open(path, "wb") as f:
+                f.write(X.iloc[:0].to_csv(index=False).encode())
+                start = f.tell()
+            self._offsets = np.array([start], dtype=np.int64)
+        start = self._offsets[first]
+        with open(path, "r+b") as f:
+            f.seek(start)
+            tail = f.read()
+            old = [tail[a - start:b - start] for a, b in zip(self._offsets[first:-1], self._offsets[first + 1:])]
+            kept = [old[i - first] if i >= first else None for i in np.flatnonzero(self.kept_)]
+            rows = [kept[i] if i < n_kept else lines[i - n_kept] for i in self.order_[first:]]
+            f.seek(start)
+            f.truncate()
+            f.writelines(rows)
+        self._offsets = np.concatenate((self._offsets[:first + 1],
+                                        start + np.cumsum([len(row) for row in rows], dtype=np.int64)))
+
     def fit(self, X, y=None):
         teams, players, keepers = X
 
@@ -754,27 +926,25 @@ class DatabaseBuilder(BaseEstimator, TransformerMixin):
         gob_team = self.good_or_bad(team, league, season)
         gob_op = self.good_or_bad(op_team, league, season)
 
-        if where == "home":
-            player_columns = [f"hp{i}" for i in range(1, 12)] + [f"hs{i}" for i in range(1, 13)]
-        else:
-            player_columns = [f"ap{i}" for i in range(1, 12)] + [f"as{i}" for i in range(1, 13)]
         lineups_to_extract = []
 
         team_db = teams.loc[(teams["name"] == team) & (teams["season"] == season)]
-        lineup_db = lineups.loc[(lineups[f"{where}_team"] == team) & (lineups["season"] == season)]
         for _, match in matches.iterrows():
             if gob_op == self.good_or_bad(match[op_col], league, season):
                 new_date = match["date"]
                 cumulative_team_stat += team_db.loc[(team_db["date"] == new_date), self.team_stats_].values.reshape(-1)
-                lineups_to_extract.append((lineup_db.loc[lineup_db["date"] == new_date], new_date))
+                game = lineup_repo.find(new_date, match["ht"], match["at"])
+                lineups_to_extract.append((np.concatenate((lineup_repo.home_players(game),
+                                                           lineup_repo.away_players(game))), new_date))
                 s += 1
         # print(cumulative_team_stat)
 
         # first test
         # return cumulative_team_stat, lineups_to_extract
 
-        lineup = lineups.loc[
-            (lineups[f"{where}_team"] == team) & (lineups["date"] == date), player_columns].values.reshape(-1)
+        ht, at = (team, op_team) if where == "home" else (op_team, team)
+        lineup_pos = lineup_repo.find(date, ht, at)
+        lineup = lineup_repo.home_players(lineup_pos) if where == "home" else lineup_repo.away_players(lineup_pos)
         lineup = [p for p in lineup if not isnull(p)]
         cpstats = []
         for pl in lineup:
@@ -788,7 +958,7 @@ class DatabaseBuilder(BaseEstimator, TransformerMixin):
             player_db = db.loc[(db["name"] == pl) & (db["team"] == team) & (db["season"] == season)]
 
             for game, new_date in lineups_to_extract:
-                if pl in game.values.reshape(-1):
+                if pl in game:
 
                     stat_row = player_db.loc[(player_db["date"] == date), stat_columns]
                     try:
@@ -832,29 +1002,27 @@ class DatabaseBuilder(BaseEstimator, TransformerMixin):
 
     def get_from_history(self, team, season, lineup):
 
-        if self._team_history.get((team, season)) is None:
+        history = self._team_history.get((team, season))
+        if history is None:
             return None
-        if self.n_games is not None and len(self._team_history[(team, season)]) < self.n_games:
+        if self.n_games is not None and len(history) < self.n_games:
             return None
-        if self.n_games is None and len(self._team_history[(team, season)]) == 0:
+        if self.n_games is None and len(history) == 0:
             return None
 
         # print(f"=={team}==")
 
-        tstat_res = np.zeros(len(self.team_stats_))
+        tstat_res = history.total.copy()
         tstat_form = np.zeros(len(self.team_stats_))
         last_date = None
-        res_total, res_form = np.zeros(3), np.zeros(3)
-        for ind, (res, date, stat_single) in enumerate(self._team_history[(team, season)]):
-            tstat_res += stat_single
-            res_total[self.res_index(res)] += 1
-
-            if self.n_games is not None and ind < self.n_games:
+        res_total, res_form = history.results.copy(), np.zeros(3)
+        if self.n_games is not None:
+            for res, date, stat_single in history.latest(self.n_games):
                 last_date = date
                 tstat_form += stat_single
                 res_form[self.res_index(res)] += 1
 
-        team_played_total = len(self._team_history[(team, season)])
+        team_played_total = len(history)
         tstat_res /= team_played_total
         res_total /= team_played_total
         if self.n_games is not None:
@@ -884,12 +1052,14 @@ class DatabaseBuilder(BaseEstimator, TransformerMixin):
             cpstat_form = np.zeros(len(self.keeper_stat_)) if pos == "Goalkeeper" else np.zeros(len(self.player_stat_))
             res_total, res_form = np.zeros(3), np.zeros(3)
 
-            for res, date, pstat_single in self._player_history.get((url, season), []):
-                cpstat_singlepl += pstat_single
-                res_total[self.res_index(res)] += 1
-                if last_date is not None and date >= last_date:
-                    cpstat_form += pstat_single
-                    res_form[self.res_index(res)] += 1
+            pl_history = self._player_history.get((url, season))
+            if pl_history is not None:
+                cpstat_singlepl += pl_history.total
+                res_total += pl_history.results
+                if last_date is not None:
+                    for res, date, pstat_single in pl_history.since(last_date):
+                        cpstat_form += pstat_single
+                        res_form[self.res_index(res)] += 1
 
             # 12 columns is "time_played" in minutes, we will use it to calculate stats per 90 minutes
             # time_played will be turned into average play time per game
@@ -948,19 +1118,27 @@ class DatabaseBuilder(BaseEstimator, TransformerMixin):
     # dodać pozycję ligową z poprzedniego sezonu
     # testing
 
+    # res_index gives None for "L", so a loss counts into every column, like res_total[None] += 1 did
+    def res_vector(self, res):
+        vector = np.zeros(3)
+        vector[self.res_index(res)] += 1
+        return vector
+
     def add_to_history(self, team, season, tstats, pstats, lineup, date, result):
+        res_vector = self.res_vector(result)
 
+        # the form of a team is its last n_games matches, older entries are not needed
         if self._team_history.get((team, season)) is None:
-            self._team_history[(team, season)] = []
-        self._team_history[(team, season)].insert(0, (result, date, tstats))
+            self._team_history[(team, season)] = RollingHistory(maxlen=self.n_games or 0)
+        self._team_history[(team, season)].add(result, date, tstats, res_vector)
 
         for pl, stat in zip(lineup, pstats):
             url = name_to_url[(pl, season, team)]
 
             if self._player_history.get((url, season)) is None:
-                self._player_history[(url, season)] = []
+                self._player_history[(url, season)] = RollingHistory()
 
-            self._player_history[(url, season)].insert(0, (result, date, stat))
+            self._player_history[(url, season)].add(result, date, stat, res_vector)
 
     def get_info_from_dbs(self, team, season, date, lineup, teams, players, keepers):
         tstats = teams.loc[(teams["name"] == team) & (teams["date"] == date), self.team_stats_].values.reshape(-1)
@@ -991,27 +1169,41 @@ class DatabaseBuilder(BaseEstimator, TransformerMixin):
             return ["X"]
         return ["A"]
 
-    def transform(self, X, y=None):
-        teams, players, keepers = X
-
-        X = pd.DataFrame(columns=self.columns_)
+    # histories are keyed by season, so seasons can be transformed independently, leagues of a season only when no
+    # player appears in two of them (a mid-season transfer would share the (url, season) history between them)
+    def shards(self, matches):
+        team_league = {(team, season): league for team, season, league in
+                       zip(itertools.chain(ginf["ht"], ginf["at"]), itertools.chain(ginf["season"], ginf["season"]),
+                           itertools.chain(ginf["league"], ginf["league"]))}
+        player_leagues = {}
+        for (_, season, team), url in name_to_url.items():
+            if (team, season) in team_league:
+                player_leagues.setdefault((url, season), set()).add(team_league[(team, season)])
+        mixed_seasons = {season for (_, season), leagues in player_leagues.items() if len(leagues) > 1}
+
+        shards = {}
+        for pos, (season, league) in enumerate(zip(matches["season"], matches["league"])):
+            key = (season, None) if season in mixed_seasons else (season, league)
+            shards.setdefault(key, []).append(pos)
+        return [np.array(positions) for positions in shards.values()]
+
+    def transform_matches(self, matches, teams, players, keepers, progress=True):
+        # rows go into a preallocated block trimmed at the end, results are kept apart because "H"/"X"/"A" are strings
+        n_results = 2 if self.exact_results else 1
+        features = np.empty((len(matches), len(self.columns_) - n_results))
+        results, rows = [], []
 
         # for _, row in ginf.iterrows():
-        for _, row in tqdm(ginf.iterrows(), total=len(ginf)):
+        for pos, (_, row) in enumerate(tqdm(matches.iterrows(), total=len(matches), disable=not progress)):
             season, date, ht, at = row["season"], row["date"], row["ht"], row["at"]
             hgoals, agoals = row["fthg"], row["ftag"]
 
             # print(f"{ht:25} - {at:25}")
             try:
 
-                lineup = lineups.loc[
-                    (lineups["season"] == season) & (lineups["home_team"] == ht) & (lineups["away_team"] == at)]
-                home_lineup = lineup.loc[:,
-                              [f"hp{i}" for i in range(1, 12)] + [f"hs{i}" for i in range(1, 13)]].values.reshape(-1)
-                home_lineup = [hp for hp in home_lineup if not isnull(hp)]
-                away_lineup = lineup.loc[:,
-                              [f"ap{i}" for i in range(1, 12)] + [f"as{i}" for i in range(1, 13)]].values.reshape(-1)
-                away_lineup = [ap for ap in away_lineup if not isnull(ap)]
+                lineup_pos = lineup_repo.find_in_season(season, ht, at)
+                home_lineup = [hp for hp in lineup_repo.home_players(lineup_pos) if not isnull(hp)]
+                away_lineup = [ap for ap in lineup_repo.away_players(lineup_pos) if not isnull(ap)]
 
                 homestats = self.get_from_history(ht, season, home_lineup)
                 awaystats = self.get_from_history(at, season, away_lineup)
@@ -1036,7 +1228,9 @@ class DatabaseBuilder(BaseEstimator, TransformerMixin):
 
                 if homestats is not None and awaystats is not None:
                     # print(len(homestats), len(awaystats), len(result), len(self.columns_))
-                    X.loc[len(X)] = np.concatenate((homestats, awaystats, result))  # results, i inne dodatkowe kolumny
+                    features[len(results)] = np.concatenate((homestats, awaystats))
+                    results.append(result)  # results, i inne dodatkowe kolumny
+                    rows.append(pos)
 
             except BaseException as e:
                 print()
@@ -1045,10 +1239,100 @@ class DatabaseBuilder(BaseEstimator, TransformerMixin):
                 # ind = ind_curr
                 raise e
 
-        return X
+        return np.array(rows, dtype=np.int64), features[:len(results)], results
+
+    # runs in a forked worker, returns the rows of the shard and the histories it has changed
+    def transform_shard(self, positions, matches, teams, players, keepers):
+        team_before = {key: len(history) for key, history in self._team_history.items()}
+        player_before = {key: len(history) for key, history in self._player_history.items()}
+
+        rows, features, results = self.transform_matches(matches.iloc[positions], teams, players, keepers,
+                                                         progress=False)
+
+        team_changed = {key: history for key, history in self._team_history.items()
+                        if len(history) != team_before.get(key, 0)}
+        player_changed = {key: history for key, history in self._player_history.items()
+                          if len(history) != player_before.get(key, 0)}
+        return positions[rows], features, results, team_changed, player_changed
+
+    def transform_parallel(self, matches, teams, players, keepers):
+        global _shared
+        _shared = (self, matches, teams, players, keepers)
+
+        rows, features, results = [], [], []
+        try:
+            with mp.get_context("fork").Pool(self.n_jobs) as pool:
+                shards = self.shards(matches)
+                for shard in tqdm(pool.imap_unordered(_transform_shard, shards), total=len(shards)):
+                    shard_rows, shard_features, shard_results, team_changed, player_changed = shard
+                    rows.append(shard_rows)
+                    features.append(shard_features)
+                    results.extend(shard_results)
+                    self._team_history.update(team_changed)
+                    self._player_history.update(player_changed)
+        finally:
+            _shared = None
+
+        # back to the order of ginf
+        n_features = len(self.columns_) - (2 if self.exact_results else 1)
+        rows = np.concatenate(rows) if rows else np.zeros(0, dtype=np.int64)
+        order = np.argsort(rows, kind="stable")
+        features = np.concatenate(features)[order] if features else np.empty((0, n_features))
+        return rows[order], features, [results[i] for i in order]
+
+    def transform(self, X, y=None):
+        teams, players, keepers = X
+
+        # only matches after the watermark, new matches have to be appended at the end of ginf.csv
+        if self._n_matches > 0 and (self._n_matches - 1 not in ginf.index or
+                                    ginf.at[self._n_matches - 1, "id_odsp"] != self._last_match):
+            raise ValueError(f"ginf.csv does not continue the saved state (last match {self._last_match})")
+
+        # fill_info averages the tables of the whole season, so a season with matches without adv_stats is
+        # transformed again from its start once it gets new matches
+        is_new = ginf.index.values >= self._n_matches
+        done = ginf.loc[~is_new]
+        redo = set(done.loc[~done["adv_stats"].astype(bool), "season"]) & set(ginf["season"].values[is_new])
+        for history in (self._team_history, self._player_history):
+            for key in [key for key in history if key[1] in redo]:
+                del history[key]
+        positions = ginf.index.values[is_new | ginf["season"].isin(redo).values]
+        matches = ginf.loc[positions]
+
+        if self.n_jobs > 1 and "fork" in mp.get_all_start_methods():
+            rows, features, results = self.transform_parallel(matches, teams, players, keepers)
+        else:
+            rows, features, results = self.transform_matches(matches, teams, players, keepers)
+
+        # rows of X.csv that stay, and the order of those followed by the new ones in ginf
+        self.kept_ = ~np.isin(self._rows, positions)
+        rows = np.concatenate((self._rows[self.kept_], positions[rows]))
+        self.order_ = np.argsort(rows, kind="stable")
+        self._rows = rows[self.order_]
+        if is_new.any():
+            self._n_matches = ginf.index[-1] + 1
+            self._last_match = ginf["id_odsp"].values[-1]
+
+        n_results = 2 if self.exact_results else 1
+        results = np.array(results, dtype=float if self.exact_results else object).reshape(-1, n_results)
+        return pd.concat([pd.DataFrame(features, columns=self.columns_[:-n_results]),
+                          pd.DataFrame(results, columns=self.columns_[-n_results:])], axis=1)
+
+
+# pool workers are forked, they get the builder and the tables through this global instead of pickling them
+_shared = None
+
+
+def _transform_shard(positions):
+    builder, matches, teams, players, keepers = _shared
+    return builder.transform_shard(positions, matches, teams, players, keepers)
 
 
-dbuilder = DatabaseBuilder(n_games=5)
+dbuilder = DatabaseBuilder(n_games=5, n_jobs=os.cpu_count())
 dbuilder.fit((teams, players, goalkeepers))
+if incremental:
+    dbuilder.load_state(STATE_PATH)
 X = dbuilder.transform((teams, players, goalkeepers))
-X.to_csv("X.csv", index=False)
+dbuilder.write_features("X.csv", X)
+dbuilder.save_state(STATE_PATH)
+save_build_state(BUILD_STATE_PATH, *built_watermark, built_tables)
@@ -0,0 +1,115 @@
+import pandas as pd
+import numpy as np
+import os
+import pyarrow as pa
+import pyarrow.feather as feather
+
+# frames of the pipeline (lineups, events, ginf) and the name/url maps of the crawler kept as Feather files in one
+# directory, string columns are written dictionary-encoded, so a frame is read back without parsing any text and
+# repeated names are stored once on disk (in memory they are plain strings again)
+
+DATASET_DIR = "dataset"
+
+# key and value columns of the dicts stored as frames, maps without value columns are sets / lists of keys
+MAPPINGS = {"name_to_url": (["name", "season", "team"], ["url"]),
+            "url_to_name": (["url"], ["name"]),
+            "player_pos": (["url"], ["position"]),
+            "player_stats": (["url"], ["weight", "height"]),
+            "table_pos": (["team", "season"], ["rank"]),
+            "valid_player_names": (["name", "team", "season"], ["valid_name"]),
+            "visited": (["url"], []),
+            "missing_data": (["home_team", "away_team", "season"], ["reason"])}
+
+
+def frame_path(name, root=DATASET_DIR):
+    return os.path.join(root, f"{name}.feather")
+
+
+def exists(name, root=DATASET_DIR):
+    return os.path.exists(frame_path(name, root))
+
+
+def save_frame(frame, name, root=DATASET_DIR):
+    os.makedirs(root, exist_ok=True)
+    frame = frame.reset_index(drop=True)
+    for c in frame.columns:
+        if pd.api.types.infer_dtype(frame[c], skipna=True) == "string":
+            frame[c] = frame[c].astype("category")
+    feather.write_feather(frame, frame_path(name, root), compression="uncompressed")
+
+
+def load_frame(name, root=DATASET_DIR):
+    table = feather.read_table(frame_path(name, root))
+    # the rest of the pipeline compares plain strings and checks for missing names with x != x, so dictionary
+    # columns are decoded by arrow into the string columns read_csv would give (pandas before 3 gives None for
+    # missing strings, those become NaN)
+    decoded = []
+    for i, field in enumerate(table.schema):
+        if pa.types.is_dictionary(field.type):
+            table = table.set_column(i, field.name, table.column(i).cast(field.type.value_type))
+            decoded.append(field.name)
+    frame = table.to_pandas()
+    for c in decoded:
+        if frame[c].dtype == object:
+            frame[c] = frame[c].fillna(np.nan)
+    return frame
+
+
+# frame from the dataset, or parsed from the csv file when the dataset doesn't have it yet
+def read_frame(name, csv_path, root=DATASET_DIR):
+    if exists(name, root):
+        return load_frame(name, root)
+    return pd.read_csv(csv_path)
+
+
+def mapping_to_frame(mapping, name):
+    key_columns, value_columns = MAPPINGS[name]
+    if isinstance(mapping, dict):
+        rows = [(key if len(key_columns) > 1 else (key,)) + (tuple(value) if len(value_columns) > 1 else (value,))
+                for key, value in mapping.items()]
+    else:
+        rows = [key if len(key_columns) > 1 else (key,) for key in mapping]
+        return pd.DataFrame(rows, columns=key_columns)
+    return pd.DataFrame(rows, columns=key_columns + value_columns)
+
+
+def frame_to_mapping(frame, name):
+    key_columns, value_columns = MAPPINGS[name]
+    # maps saved as lists of keys before they had values come back as lists
+    value_columns = [c for c in value_columns if c in frame.columns]
+    keys = list(zip(*(frame[c].tolist() for c in key_columns))) if len(key_columns) > 1 else frame[
+        key_columns[0]].tolist()
+    if name == "visited":
+        return set(keys)
+    if not value_columns:
+        return keys
+    if len(value_columns) > 1:
+        return dict(zip(keys, (list(value) for value in zip(*(frame[c].tolist() for c in value_columns)))))
+    return dict(zip(keys, frame[value_columns[0]].tolist()))
+
+
+def save_mapping(mapping, name, root=DATASET_DIR):
+    save_frame(mapping_to_frame(mapping, name), name, root)
+
+
+def load_mapping(name, root=DATASET_DIR):
+    return frame_to_mapping(load_frame(name, root), name)
+
+
+# map from the dataset, or from the pickle written before the dataset existed
+def read_mapping(name, pickle_path, root=DATASET_DIR):
+    if exists(name, root):
+        return load_mapping(name, root)
+    return pd.read_pickle(pickle_path)
+
+
+# moves csv files and pickles of the working directory into the dataset
+if __name__ == "__main__":
+    for name in ["lineups", "events", "ginf"]:
+        if os.path.exists(f"{name}.csv"):
+            save_frame(pd.read_csv(f"{name}.csv"), name)
+            print(f"{name}.csv -> {frame_path(name)}")
+    for name in MAPPINGS:
+        if os.path.exists(f"{name}.pkl"):
+            save_mapping(pd.read_pickle(f"{name}.pkl"), name)
+            print(f"{name}.pkl -> {frame_path(name)}")
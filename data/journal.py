@@ -0,0 +1,135 @@
+import json
+import os
+import queue
+import re
+import threading
+
+# write-ahead log of the crawler cache, every change of the cache maps and every new lineup row is one json line,
+# lines are written and synced by a background thread so the crawl never waits for the disk
+# the log is split into numbered segments, a checkpoint starts a new segment, saves the full state in the background
+# and removes the segments the saved state already contains, on load the state is read and the rest is replayed
+
+SEGMENT = re.compile(r"journal\.(\d+)\.jsonl$")
+_ROTATE = object()
+
+
+def segments(root):
+    if not os.path.exists(root):
+        return []
+    return sorted(int(m.group(1)) for m in map(SEGMENT.match, os.listdir(root)) if m is not None)
+
+
+def segment_path(root, n):
+    return os.path.join(root, f"journal.{n}.jsonl")
+
+
+def _decode(value):
+    return tuple(value) if isinstance(value, list) else value
+
+
+# (name, key, value) of all entries left by previous runs, in the order they were written
+def read_journal(root):
+    for n in segments(root):
+        with open(segment_path(root, n), encoding="utf-8") as f:
+            for line in f:
+                try:
+                    name, key, value = json.loads(line)
+                except ValueError:  # the last line may be cut by a crash
+                    continue
+                yield name, _decode(key), value
+
+
+class CacheJournal:
+    # fresh drops the segments of previous runs
+    def __init__(self, root, fresh=False):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+        if fresh:
+            for n in segments(root):
+                os.remove(segment_path(root, n))
+        self.segment = max(segments(root), default=0) + 1
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._rotated = threading.Condition()
+        self._current = self.segment
+        self._checkpoint = None
+        self._pending = None
+        self._writer = threading.Thread(target=self._write, args=(self.segment,), daemon=True)
+        self._writer.start()
+
+    def append(self, name, key=None, value=None):
+        self._queue.put((name, key, value))
+
+    # segment is the first one, self.segment may be moved on by a checkpoint before the thread runs
+    def _write(self, segment):
+        f = open(segment_path(self.root, segment), "a", encoding="utf-8")
+        while True:
+            batch = [self._queue.get()]
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            for entry in batch:
+                if entry is None:
+                    f.close()
+                    return
+                if entry is _ROTATE:
+                    f.close()
+                    segment += 1
+                    f = open(segment_path(self.root, segment), "a", encoding="utf-8")
+                    with self._rotated:
+                        self._current = segment
+                        self._rotated.notify_all()
+                    continue
+                f.write(json.dumps(entry, default=lambda o: o.item()) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    # save() has to write a copy of the state taken before the call, it runs in the background and the segments
+    # written up to now are removed once it finished, while a save is running the crawl doesn't wait for it, only the
+    # latest of the checkpoints made meanwhile is saved after it (its copy has everything the skipped ones had)
+    def checkpoint(self, save):
+        done = self.segment
+        self.segment += 1
+        self._queue.put(_ROTATE)
+
+        with self._lock:
+            if self._checkpoint is not None:
+                self._pending = (save, done)
+                return
+            self._checkpoint = threading.Thread(target=self._save, args=(save, done))
+            self._checkpoint.start()
+
+    def _save(self, save, done):
+        try:
+            while True:
+                save()
+                # a segment is removed once the writer has moved past it
+                with self._rotated:
+                    self._rotated.wait_for(lambda: self._current > done)
+                for n in segments(self.root):
+                    if n <= done:
+                        os.remove(segment_path(self.root, n))
+                with self._lock:
+                    if self._pending is None:
+                        self._checkpoint = None
+                        return
+                    (save, done), self._pending = self._pending, None
+        except BaseException:
+            # the segments stay, the next checkpoint starts a new save
+            with self._lock:
+                self._checkpoint = self._pending = None
+            raise
+
+    # waits for the running checkpoint and the one waiting after it
+    def wait(self):
+        checkpoint = self._checkpoint
+        if checkpoint is not None:
+            checkpoint.join()
+
+    def close(self):
+        self._queue.put(None)
+        self._writer.join()
+        self.wait()
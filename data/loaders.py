@@ -0,0 +1,148 @@
+import pandas as pd
+import numpy as np
+import os
+
+from dataset import read_frame, exists, frame_path, load_frame, save_frame
+
+
+# events.csv sorted once by id_odsp (stable, so events keep their order inside a match), the events of a match
+# are a zero-copy slice of the sorted frame found through the offset arrays
+class EventIndex:
+    def __init__(self, events):
+        self.events = events.sort_values("id_odsp", kind="stable")
+
+        ids = self.events["id_odsp"].values
+        starts = np.flatnonzero(np.r_[True, ids[1:] != ids[:-1]]) if len(ids) > 0 else np.zeros(0, dtype=np.int64)
+        self._starts = starts
+        self._stops = np.r_[starts[1:], len(ids)].astype(np.int64)
+        self._positions = {match_id: i for i, match_id in enumerate(ids[starts])}
+
+    def __contains__(self, match_id):
+        return match_id in self._positions
+
+    def match(self, match_id):
+        i = self._positions.get(match_id)
+        if i is None:
+            return self.events.iloc[0:0]
+        return self.events.iloc[self._starts[i]:self._stops[i]]
+
+
+CORRECTION_COLUMNS = ["id_event", "swap", "player"]
+
+
+# corrections of events.csv written by the translator: event_team and opponent of the events with swap are exchanged,
+# player is filled in where the event has none
+def apply_corrections(events, corrections):
+    swap = events["id_event"].isin(corrections.loc[corrections["swap"].astype(bool), "id_event"]).values
+    events.loc[swap, ["event_team", "opponent"]] = events.loc[swap, ["opponent", "event_team"]].values
+
+    players = events["id_event"].map(corrections.dropna(subset=["player"]).set_index("id_event")["player"])
+    fill = (players.notna() & events["player"].isna()).values
+    events.loc[fill, "player"] = players[fill].values
+    return events
+
+
+# (id_odsp, home, name) of every player named in the events of a match, for the side whose lineup he should be in, in
+# the order the events name them (the order the translator used to add them to its sets)
+# Assumption: every player listed as player2 is from the event team, (except for corners and own goals)
+def extract_match_players(events, ginf):
+    event_home = (events["event_team"].values == events["id_odsp"].map(ginf.set_index("id_odsp")["ht"]).values)
+    sub = (events["event_type"] == 7).values
+    switched = ((events["event_type"] == 2) | (events["event_type2"] == 15)).values
+
+    parts = []
+    for rank, column, of_sub in [(0, "player_in", True), (1, "player_out", True), (0, "player", False),
+                                 (1, "player2", False)]:
+        names = events[column].values
+        rows = (sub if of_sub else ~sub) & pd.notna(names)
+        home = event_home if of_sub else event_home != switched
+        parts.append(pd.DataFrame({"position": np.flatnonzero(rows), "rank": rank,
+                                   "id_odsp": events["id_odsp"].values[rows], "home": home[rows],
+                                   "name": names[rows]}))
+    players = pd.concat(parts, ignore_index=True).sort_values(["position", "rank"], kind="stable")
+    return players.drop_duplicates(["id_odsp", "home", "name"])[["id_odsp", "home", "name"]].reset_index(drop=True)
+
+
+# names of the players of both sides of every match from the events
+class MatchPlayers:
+    def __init__(self, players):
+        self.players = players
+        self._names = {}
+        for match_id, home, name in zip(players["id_odsp"], players["home"], players["name"]):
+            self._names.setdefault((match_id, bool(home)), []).append(name)
+
+    def sets(self, match_id):
+        return set(self._names.get((match_id, True), ())), set(self._names.get((match_id, False), ()))
+
+
+# extracted once and kept in the dataset, extracted again when the events (or the corrections applied to them) or
+# ginf (the sides come from its home teams) are newer than the saved frame
+def load_match_players(event_index, ginf, events_path="events.csv", corrections_path="event_corrections.csv",
+                       ginf_path="ginf.csv"):
+    sources = [p for p in [events_path, frame_path("events"), corrections_path, frame_path("event_corrections"),
+                           ginf_path, frame_path("ginf")] if os.path.exists(p)]
+    if exists("match_players") and all(os.path.getmtime(p) <= os.path.getmtime(frame_path("match_players"))
+                                       for p in sources):
+        return MatchPlayers(load_frame("match_players"))
+    players = extract_match_players(event_index.events, ginf)
+    save_frame(players, "match_players")
+    return MatchPlayers(players)
+
+
+def load_corrections(path="event_corrections.csv"):
+    if exists("event_corrections") or os.path.exists(path):
+        return read_frame("event_corrections", path)
+    return None
+
+
+def load_events(path="events.csv", corrections=None):
+    events = read_frame("events", path)
+    if corrections is not None:
+        apply_corrections(events, corrections)
+    return EventIndex(events)
+
+
+HOME_COLUMNS = [f"hp{i}" for i in range(1, 12)] + [f"hs{i}" for i in range(1, 13)]
+AWAY_COLUMNS = [f"ap{i}" for i in range(1, 12)] + [f"as{i}" for i in range(1, 13)]
+NO_PLAYERS = np.empty(0, dtype=object)
+
+
+# lineups.csv loaded once, matches are found through dicts keyed by (date, home_team, away_team) and
+# (season, home_team, away_team), the 23 players of each side are split out into arrays up front
+class LineupRepository:
+    def __init__(self, lineups):
+        self.lineups = lineups.drop_duplicates(subset=["date", "home_team", "away_team"], keep='first')
+        self.refresh()
+
+    # has to be called after self.lineups is edited in place
+    def refresh(self):
+        self.home = self.lineups[HOME_COLUMNS].values.astype(object)
+        self.away = self.lineups[AWAY_COLUMNS].values.astype(object)
+
+        self._by_date, self._by_season = {}, {}
+        for pos, (date, season, home_team, away_team) in enumerate(zip(
+                self.lineups["date"], self.lineups["season"], self.lineups["home_team"], self.lineups["away_team"])):
+            self._by_date.setdefault((date, home_team, away_team), pos)
+            self._by_season.setdefault((season, home_team, away_team), pos)
+
+    def __len__(self):
+        return len(self.lineups)
+
+    def find(self, date, home_team, away_team):
+        return self._by_date.get((date, home_team, away_team))
+
+    def find_in_season(self, season, home_team, away_team):
+        return self._by_season.get((season, home_team, away_team))
+
+    def row(self, pos):
+        return self.lineups.iloc[pos]
+
+    def home_players(self, pos):
+        return NO_PLAYERS if pos is None else self.home[pos]
+
+    def away_players(self, pos):
+        return NO_PLAYERS if pos is None else self.away[pos]
+
+
+def load_lineups(path="lineups.csv"):
+    return LineupRepository(read_frame("lineups", path))
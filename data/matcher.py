@@ -0,0 +1,210 @@
+# matching of player names from events.csv to the names in lineups, the same decisions as the word / distance tests of
+# translator.fit_rest_names but with the candidates of every (team, season) indexed by words and character n-grams
+# and with edit distances that stop as soon as a candidate can't be among the closest ones
+
+
+# edit distance of a and b, once every alignment costs more than bound the search stops and returns bound + 1
+def levenshtein(a, b, bound=None):
+    if a == b:
+        return 0
+    if len(a) < len(b):
+        a, b = b, a
+    if bound is None:
+        bound = len(a)
+    if len(a) - len(b) > bound:
+        return bound + 1
+
+    # common prefix and suffix don't change the distance
+    start = 0
+    while start < len(b) and a[start] == b[start]:
+        start += 1
+    end_a, end_b = len(a), len(b)
+    while end_b > start and a[end_a - 1] == b[end_b - 1]:
+        end_a, end_b = end_a - 1, end_b - 1
+    a, b = a[start:end_a], b[start:end_b]
+    if not b:
+        return len(a) if len(a) <= bound else bound + 1
+
+    # bit-parallel edit distance (Myers / Hyyro), every column of the dp table is a pair of bit vectors with the
+    # vertical +1 / -1 steps, the score is the last row and it can drop by at most one per remaining column
+    positions = {}
+    for i, cb in enumerate(b):
+        positions[cb] = positions.get(cb, 0) | (1 << i)
+    full, last = (1 << len(b)) - 1, 1 << (len(b) - 1)
+    plus, minus, score = full, 0, len(b)
+    for k, ca in enumerate(a, 1):
+        eq = positions.get(ca, 0)
+        xv = eq | minus
+        xh = (((eq & plus) + plus) ^ plus) | eq
+        h_plus = minus | (~(xh | plus) & full)
+        h_minus = plus & xh
+        if h_plus & last:
+            score += 1
+        elif h_minus & last:
+            score -= 1
+        if score - (len(a) - k) > bound:
+            return bound + 1
+        h_plus = ((h_plus << 1) | 1) & full
+        h_minus = (h_minus << 1) & full
+        plus = h_minus | (~(xv | h_plus) & full)
+        minus = h_plus & xv
+    return score if score <= bound else bound + 1
+
+
+# distance.levenshtein(a, b, normalized=True): edit distance over the length of the longer name
+def normalized(a, b):
+    if a == b:
+        return 0.0
+    if len(a) == 0 or len(b) == 0:
+        return 1.0
+    return levenshtein(a, b) / float(max(len(a), len(b)))
+
+
+def ngrams(name, n=3):
+    padded = f" {name} "
+    return {padded[i:i + n] for i in range(max(len(padded) - n + 1, 1))}
+
+
+# players seen in the lineups of one team in one season, with the n-grams and distances computed for them (names are
+# only compared with the candidates of their own team and season, so the caches never outgrow one index)
+class CandidateIndex:
+    def __init__(self, n=3):
+        self.n = n
+        self.by_word = {}
+        self.without_words = set()
+        self._distances = {}
+        self._above = {}  # bound the raw distance of a pair is known to exceed
+        self._ngrams = {}
+
+    def add(self, names):
+        for name in names:
+            words = name.split()
+            if not words:
+                self.without_words.add(name)
+            for word in words:
+                self.by_word.setdefault(word, set()).add(name)
+
+    # names sharing a word with name (the only ones one name can contain all words of the other)
+    def sharing_words(self, name):
+        shared = set(self.without_words)
+        for word in name.split():
+            shared.update(self.by_word.get(word, ()))
+        return shared
+
+    def ngrams(self, name):
+        grams = self._ngrams.get(name)
+        if grams is None:
+            grams = self._ngrams[name] = ngrams(name, self.n)
+        return grams
+
+    # normalized distance, None when it is known to be above bound / length of the longer name
+    def distance(self, name, candidate, bound=None):
+        score = self._distances.get((name, candidate))
+        if score is not None:
+            return score
+        if bound is None or name == candidate or len(name) == 0 or len(candidate) == 0:
+            score = self._distances[(name, candidate)] = normalized(name, candidate)
+            return score
+        if self._above.get((name, candidate), -1) >= bound:
+            return None
+        # every edit changes at most n of the n-grams, so the n-grams of one name missing in the other bound it
+        if len(self.ngrams(name) - self.ngrams(candidate)) > self.n * bound:
+            self._above[(name, candidate)] = bound
+            return None
+        d = levenshtein(name, candidate, bound)
+        if d > bound:
+            self._above[(name, candidate)] = bound
+            return None
+        score = self._distances[(name, candidate)] = d / float(max(len(name), len(candidate)))
+        return score
+
+
+# dists of translator.fit_rest_names, (normalized distance, candidate) in ascending order, the first two are found
+# with bounded distances and the full list is only computed when it is iterated (it's printed on conflicts)
+class Ranking:
+    def __init__(self, index, name, candidates):
+        self.index = index
+        self.name = name
+        self.candidates = list(candidates)
+        self._top = None
+        self._all = None
+
+    def __len__(self):
+        return len(self.candidates)
+
+    def __iter__(self):
+        return iter(self.all())
+
+    def __getitem__(self, i):
+        if self._all is None and i in (0, 1):
+            return self.top()[i]
+        return self.all()[i]
+
+    def all(self):
+        if self._all is None:
+            self._all = sorted((self.index.distance(self.name, candidate), candidate)
+                               for candidate in self.candidates)
+        return self._all
+
+    def top(self):
+        if self._top is not None:
+            return self._top
+
+        # candidates with the most n-grams in common first, so the bound gets tight early
+        grams = self.index.ngrams(self.name)
+        order = sorted(self.candidates, key=lambda c: -len(grams & self.index.ngrams(c)))
+        top = sorted((self.index.distance(self.name, candidate), candidate) for candidate in order[:2])
+        for candidate in order[2:]:
+            longer = max(len(self.name), len(candidate))
+            # one more than needed, the exact score decides below
+            score = self.index.distance(self.name, candidate, int(top[-1][0] * longer) + 1)
+            if score is not None and (score, candidate) < top[-1]:
+                top = sorted(top + [(score, candidate)])[:2]
+        self._top = top
+        return top
+
+
+# indexes of the max_indexes (team, season) used last are kept, an index dropped earlier is built again from the
+# lineups it is given (only its caches are lost)
+class NameMatcher:
+    def __init__(self, n=3, max_indexes=64):
+        self.n = n
+        self.max_indexes = max_indexes
+        self._indexes = {}
+
+    def index(self, team, season):
+        index = self._indexes.pop((team, season), None)
+        if index is None:
+            index = CandidateIndex(self.n)
+            if len(self._indexes) >= self.max_indexes:
+                del self._indexes[next(iter(self._indexes))]
+        self._indexes[(team, season)] = index
+        return index
+
+    # set_to_lineup, lineup_to_set of translator.fit_rest_names: pairs where all words of the shorter name are words
+    # of the longer one
+    def word_matches(self, names, lineup, team, season):
+        index = self.index(team, season)
+        index.add(lineup)
+
+        set_to_lineup, lineup_to_set = {}, {}
+        for name in names:
+            words = name.split()
+            # a name without words fits in every name
+            for candidate in index.sharing_words(name) if words else lineup:
+                if candidate not in lineup:
+                    continue
+                candidate_words = candidate.split()
+                if len(words) > len(candidate_words):
+                    fits = all(word in words for word in candidate_words)
+                elif len(words) < len(candidate_words):
+                    fits = all(word in candidate_words for word in words)
+                else:
+                    fits = False
+                if fits:
+                    set_to_lineup.setdefault(name, []).append(candidate)
+                    lineup_to_set.setdefault(candidate, []).append(name)
+        return set_to_lineup, lineup_to_set
+
+    def ranking(self, name, lineup, team, season):
+        return Ranking(self.index(team, season), name, lineup)
@@ -0,0 +1,101 @@
+import gzip
+import hashlib
+import os
+import threading
+import time
+
+# raw html of the crawled pages, every page is stored gzipped once under the sha256 of its content, the index maps
+# urls to (sha, fetch time, ETag, Last-Modified) and is an append-only tab separated file, a url fetched again gets a
+# new line and the last line of the url wins, lines written before the validators were kept have only 3 fields
+
+PAGES_DIR = "pages"
+
+
+class PageStore:
+    def __init__(self, root=PAGES_DIR):
+        self.root = root
+        self.index_path = os.path.join(root, "index.tsv")
+        self._index = {}
+        self._lock = threading.Lock()
+        os.makedirs(os.path.join(root, "objects"), exist_ok=True)
+
+        if os.path.exists(self.index_path):
+            with open(self.index_path, encoding="utf-8") as f:
+                for line in f:
+                    parts = line.rstrip("\n").split("\t")
+                    if not line.endswith("\n") or len(parts) not in (3, 5):  # a line cut by a crash is skipped
+                        continue
+                    url, sha, fetched_at, etag, modified = parts + [""] * (5 - len(parts))
+                    self._index[url] = (sha, float(fetched_at), etag or None, modified or None)
+
+    def object_path(self, sha):
+        return os.path.join(self.root, "objects", sha[:2], f"{sha}.html.gz")
+
+    def __contains__(self, url):
+        return url in self._index
+
+    def __len__(self):
+        return len(self._index)
+
+    def urls(self, prefix=""):
+        return [url for url in self._index if url.startswith(prefix)]
+
+    def fetched_at(self, url):
+        return self._index[url][1]
+
+    # stored and fetched (or revalidated) at most ttl seconds ago, ttl None never expires
+    def fresh(self, url, ttl=None):
+        return url in self._index and (ttl is None or time.time() - self.fetched_at(url) <= ttl)
+
+    # (ETag, Last-Modified) the page was served with, for a conditional GET
+    def validators(self, url):
+        entry = self._index.get(url)
+        if entry is None:
+            return None, None
+        return entry[2], entry[3]
+
+    def _append(self, url, entry):
+        sha, fetched_at, etag, modified = entry
+        with self._lock:
+            with open(self.index_path, "a", encoding="utf-8") as f:
+                f.write(f"{url}\t{sha}\t{fetched_at}\t{etag or ''}\t{modified or ''}\n")
+            self._index[url] = entry
+
+    def put(self, url, html, fetched_at=None, etag=None, modified=None):
+        data = html.encode("utf-8")
+        sha = hashlib.sha256(data).hexdigest()
+        fetched_at = time.time() if fetched_at is None else fetched_at
+
+        path = self.object_path(sha)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # written next to the target and renamed, so a crash never leaves a cut object under a valid name
+            with gzip.open(path + ".tmp", "wb") as f:
+                f.write(data)
+            os.replace(path + ".tmp", path)
+
+        self._append(url, (sha, fetched_at, etag, modified))
+        return sha
+
+    # the site answered 304 Not Modified, the stored page counts as fetched now
+    def touch(self, url, fetched_at=None):
+        sha, _, etag, modified = self._index[url]
+        self._append(url, (sha, time.time() if fetched_at is None else fetched_at, etag, modified))
+
+    def load(self, sha):
+        with gzip.open(self.object_path(sha), "rb") as f:
+            return f.read().decode("utf-8")
+
+    def get(self, url):
+        entry = self._index.get(url)
+        if entry is None:
+            return None
+        return self.load(entry[0])
+
+    # index without the lines of urls fetched again
+    def compact(self):
+        with self._lock:
+            with open(self.index_path + ".tmp", "w", encoding="utf-8") as f:
+                for url, (sha, fetched_at, etag, modified) in self._index.items():
+                    f.write(f"{url}\t{sha}\t{fetched_at}\t{etag or ''}\t{modified or ''}\n")
+            os.replace(self.index_path + ".tmp", self.index_path)
@@ -0,0 +1,180 @@
+import numpy as np
+import pandas as pd
+import itertools
+import math
+from collections import deque
+
+
+# maps the key of a row, (name or id, season, round), to its positions in a table
+class RowIndex:
+    def __init__(self):
+        self._positions = {}
+
+    def __contains__(self, key):
+        return key in self._positions
+
+    def add(self, key, position):
+        self._positions.setdefault(key, []).append(position)
+
+    # every row stored under the key, empty when the key is missing
+    def positions(self, key):
+        return self._positions.get(key, [])
+
+    # like a DataFrame mask followed by .values[0], raises KeyError when the key is missing
+    def first(self, key):
+        return self._positions[key][0]
+
+    def items(self):
+        return self._positions.items()
+
+
+# per-match table of counters, rows are keyed by (name or id, season, round) and kept in a preallocated
+# NumPy block indexed by the position of the stat column, DataFrame is created only once in to_frame()
+class StatAccumulator:
+    def __init__(self, columns, key_columns, n_info, capacity=32):
+        self.columns = list(columns)
+        self.n_info = n_info
+
+        self._key_pos = [self.columns.index(c) for c in key_columns]
+        self._stat_index = {c: i for i, c in enumerate(self.columns[n_info:])}
+
+        self._info = []
+        self._tags = []
+        self._values = np.zeros((capacity, len(self.columns) - n_info), dtype=np.int64)
+        self.index = RowIndex()
+
+    def __len__(self):
+        return len(self._info)
+
+    def __contains__(self, key):
+        return key in self.index
+
+    # tag is kept next to the row without being a column of the table, see tags()
+    def add_row(self, info, tag=None):
+        if len(self._info) == len(self._values):
+            self._values = np.concatenate((self._values, np.zeros_like(self._values)))
+
+        self.index.add(tuple(info[p] for p in self._key_pos), len(self._info))
+        self._info.append(list(info))
+        self._tags.append(tag)
+
+    # same as the old DataFrame mask: updating a key that is not in the table does nothing
+    def add(self, key, column, value=1):
+        self._values[self.index.positions(key), self._stat_index[column]] += value
+
+    def add_values(self, key, values):
+        self._values[self.index.positions(key)] += values
+
+    def set(self, key, column, value):
+        self._values[self.index.positions(key), self._stat_index[column]] = value
+
+    def get(self, key, column):
+        return self._values[self.index.first(key), self._stat_index[column]]
+
+    def to_frame(self):
+        info = pd.DataFrame(self._info, columns=self.columns[:self.n_info])
+        stats = pd.DataFrame(self._values[:len(self._info)], columns=self.columns[self.n_info:])
+        return pd.concat([info, stats], axis=1)
+
+
+# append-only table for the whole build, every StatAccumulator is stored as its own chunk so appending a match
+# never copies what is already in the table, chunks are joined only once in to_frame()
+class ColumnarStore:
+    def __init__(self, columns, key_columns, n_info):
+        self.columns = list(columns)
+        self.key_columns = list(key_columns)
+        self.n_info = n_info
+
+        self._info_chunks = []
+        self._tag_chunks = []
+        self._value_chunks = []
+        self.index = RowIndex()
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def __contains__(self, key):
+        return key in self.index
+
+    def extend(self, acc):
+        chunk = len(self._value_chunks)
+        self._info_chunks.append(acc._info)
+        self._tag_chunks.append(acc._tags)
+        self._value_chunks.append(acc._values[:len(acc)].copy())
+        for key, rows in acc.index.items():
+            for row in rows:
+                self.index.add(key, (chunk, row))
+        self._size += len(acc)
+
+    # tags of all rows, in the order of to_frame()
+    def tags(self):
+        return np.array(list(itertools.chain.from_iterable(self._tag_chunks)), dtype=object)
+
+    def to_frame(self):
+        info = pd.DataFrame(list(itertools.chain.from_iterable(self._info_chunks)),
+                            columns=self.columns[:self.n_info])
+        if self._value_chunks:
+            values = np.concatenate(self._value_chunks)
+        else:
+            values = np.zeros((0, len(self.columns) - self.n_info), dtype=np.int64)
+        stats = pd.DataFrame(values, columns=self.columns[self.n_info:])
+        return pd.concat([info, stats], axis=1)
+
+
+# history of a team or a player in one season, keeps running totals of the stats and the results so they don't have to
+# be summed over the whole history on every lookup, entries are kept only up to maxlen (None keeps all of them)
+# the total of the stats is exact: it is kept as the partials of math.fsum column by column (an entry adds a partial
+# only where it can't be added without rounding, so integral stats stay one array and fill_info averages a few), a
+# lookup rounds the exact sum once, so it doesn't depend on the order the entries were added in
+class RollingHistory:
+    def __init__(self, maxlen=None):
+        self.results = np.zeros(3)
+        self._partials = []
+        self._count = 0
+        self._entries = deque(maxlen=maxlen)
+        self._ordered = True
+
+    def __len__(self):
+        return self._count
+
+    @property
+    def total(self):
+        if len(self._partials) == 1:
+            return self._partials[0]
+        return np.array([math.fsum(column) for column in zip(*self._partials)])
+
+    # two-sum of the new stats with every partial, the rounding error of each sum is the partial kept in its place
+    def _accumulate(self, stats):
+        x = np.array(stats, dtype=float)
+        partials = []
+        for partial in self._partials:
+            hi = x + partial
+            virtual = hi - x
+            lo = (x - (hi - virtual)) + (partial - virtual)
+            if lo.any():
+                partials.append(lo)
+            x = hi
+        partials.append(x)
+        self._partials = partials
+
+    def add(self, result, date, stats, result_vector):
+        self._accumulate(stats)
+        self.results += result_vector
+        self._count += 1
+
+        if self._entries and date < self._entries[-1][1]:
+            self._ordered = False
+        self._entries.append((result, date, stats))
+
+    # n newest entries, newest first
+    def latest(self, n):
+        return itertools.islice(reversed(self._entries), n)
+
+    # entries played on date or later, newest first
+    def since(self, date):
+        for entry in reversed(self._entries):
+            if entry[1] >= date:
+                yield entry
+            elif self._ordered:
+                return
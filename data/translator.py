@@ -1,40 +1,40 @@
 import pandas as pd
-from math import isnan
-import distance
+import numpy as np
 import pickle
+import sys
+import os
+import re
+import multiprocessing as mp
 
-valid_player_names = {}
-
-events = pd.read_csv("events.csv")
-ginf = pd.read_csv('ginf.csv')
-lineups = pd.read_csv("lineups.csv")
-labels = ["date", "home_team", "away_team"]
-lineups = lineups.drop_duplicates(subset=labels, keep='first')
-
-
-# budowanie słownika z nazwami piłkarzy
-def add_players_to_set(ev, ev_set, op_set):
-    pl1, pl2, pl_in, pl_out = ev['player'], ev['player2'], ev['player_in'], ev['player_out']
+from loaders import load_events, load_lineups, load_match_players, load_corrections, CORRECTION_COLUMNS
+from dataset import read_frame, read_mapping, save_frame, save_mapping
+from matcher import NameMatcher
+from codes import code_teams
 
-    if ev['event_type'] == 7:  # substitution
-        ev_set.update([pl_in, pl_out])
-    # Assumption: every player listed as player2 is from the event team, (except for corners and own goals)
-    else:
-        is_not_switched = (ev["event_type"] != 2) and (ev["event_type2"] != 15)
-        try:
-            if isnan(pl1): pass
-        except TypeError:  # it is string, therefore it is a name
-            if is_not_switched:
-                ev_set.add(pl1)
-            else:
-                op_set.add(pl1)
-        try:
-            if isnan(pl2): pass
-        except TypeError:
-            if is_not_switched:
-                ev_set.add(pl2)
-            else:
-                op_set.add(pl2)
+valid_player_names = {}
+matcher = NameMatcher()
+
+# conflicts left by the batch mode, reviewed by filling in the resolution column
+CONFLICTS_PATH = "name_conflicts.csv"
+
+# events.csv mistakes found by resolve_match, id_event -> (event_team and opponent swapped, player filled in), saved
+# with the names and applied by database_build when it loads the events, the corrections of previous runs are
+# applied to the events here as well, so a mistake found again is toggled relative to the corrected event
+CORRECTIONS_PATH = "event_corrections.csv"
+saved_corrections = load_corrections(CORRECTIONS_PATH)
+corrections = {} if saved_corrections is None else {
+    id_event: (bool(swap), player if player == player else None)
+    for id_event, swap, player in zip(saved_corrections["id_event"], saved_corrections["swap"],
+                                      saved_corrections["player"])}
+loaded_corrections = dict(corrections)
+
+event_index = load_events("events.csv", saved_corrections)
+events = event_index.events
+ginf = read_frame("ginf", 'ginf.csv')
+lineup_repo = load_lineups("lineups.csv")
+code_teams({"ginf": ginf, "events": events, "lineups": lineup_repo.lineups})
+# budowanie słownika z nazwami piłkarzy, names of both sides of every match are extracted from events once
+match_players = load_match_players(event_index, ginf, "events.csv", CORRECTIONS_PATH, "ginf.csv")
 
 
 def filter_out_correct(player_set, lineup, team, season):
@@ -45,20 +45,6 @@ def filter_out_correct(player_set, lineup, team, season):
     return unmatched
 
 
-def append_to_dictionary(d, k, e):
-    if d.get(k) is None:
-        d[k] = [e]
-    else:
-        d[k].append(e)
-
-
-def check_fit(full_name, to_fit):
-    for word in to_fit:
-        if word not in full_name:
-            return False
-    return True
-
-
 def resolve_match(pl, lineup, other_lineup, team, other_team, season, match_id,
                   set_to_lineup, lineup_to_set, dists):
     # by word_match
@@ -93,44 +79,18 @@ def resolve_match(pl, lineup, other_lineup, team, other_team, season, match_id,
     if valid_player_names.get((pl, other_team, season), pl) in other_lineup:
         name = valid_player_names.get((pl, other_team, season), pl)
         # print(pl, name, team, other_team)
-        ev = events.loc[(events['id_odsp'] == match_id) & (events["player"] == name) & (events["event_team"] == team)]
-        if len(ev) == 1:
-            vals = ev.values.reshape(-1)
-            events.loc[ev.index[0]] = vals[
-                [0, 1, 2, 3, 4, 5, 6, 7, 9, 8, 10, 11, 12, 13, 14, 15, 16, 17, 18, 19, 20, 21]]
-            print(f"FOUND MISTAKE WHERE {name} SHOULD BELONG TO TEAM {other_team}")
-            return True
-
-        ev = events.loc[
-            (events['id_odsp'] == match_id) & (events["player"] == name) & (events["event_team"] == other_team)]
-
-        if len(ev) == 1:
-            vals = ev.values.reshape(-1)
-            events.loc[ev.index[0]] = vals[
-                [0, 1, 2, 3, 4, 5, 6, 7, 9, 8, 10, 11, 12, 13, 14, 15, 16, 17, 18, 19, 20, 21]]
-            print(f"FOUND MISTAKE WHERE {name} SHOULD BELONG TO TEAM {other_team}")
-            return True
-
-        ev = events.loc[(events['id_odsp'] == match_id) & (events["player2"] == name) & (events["event_team"] == team)]
-        if len(ev) == 1:
-            vals = ev.values.reshape(-1)
-            events.loc[ev.index[0]] = vals[
-                [0, 1, 2, 3, 4, 5, 6, 7, 9, 8, 10, 11, 12, 13, 14, 15, 16, 17, 18, 19, 20, 21]]
-            print(f"FOUND MISTAKE WHERE {name} SHOULD BELONG TO TEAM {other_team}")
-            if nantest(ev["player"].values.reshape(-1)[0]):
-                events.loc[ev.index[0], "player"] = name
-            return True
-
-        ev = events.loc[
-            (events['id_odsp'] == match_id) & (events["player2"] == name) & (events["event_team"] == other_team)]
-        if len(ev) == 1:
-            vals = ev.values.reshape(-1)
-            events.loc[ev.index[0]] = vals[
-                [0, 1, 2, 3, 4, 5, 6, 7, 9, 8, 10, 11, 12, 13, 14, 15, 16, 17, 18, 19, 20, 21]]
-            print(f"FOUND MISTAKE WHERE {name} SHOULD BELONG TO TEAM {other_team}")
-            if nantest(ev["player"].values.reshape(-1)[0]):
-                events.loc[ev.index[0], "player"] = name
-            return True
+        evs = event_index.match(match_id)
+        event_teams = evs["event_team"].values
+        # player first, then player2 (filled in as player when the event has none), each with team then other_team
+        for column, fill in (("player", False), ("player2", True)):
+            by_name = evs[column].values == name
+            for ev_team in (team, other_team):
+                rows = np.flatnonzero(by_name & (event_teams == ev_team))
+                if len(rows) == 1:
+                    ev = evs.iloc[rows[0]]
+                    correct_event(ev, name if fill and nantest(ev["player"]) else None)
+                    print(f"FOUND MISTAKE WHERE {name} SHOULD BELONG TO TEAM {other_team}")
+                    return True
 
         # while True:
         #     print(f"PLAYER {name} POSSIBLY BELONGING TO TEAM {other_team}. IS THAT TRUE?")
@@ -150,25 +110,41 @@ def nantest(x):
     return x != x
 
 
-def fit_rest_names(players_from_events, lineup, other_lineup, team, other_team, season, match_id,
-                   dist_f=distance.levenshtein):
-    set_to_lineup, lineup_to_set = {}, {}
+# the swap is also made in events, later matches of this run read the corrected teams
+def correct_event(ev, player=None):
+    swapped, filled = corrections.get(ev["id_event"], (False, None))
+    corrections[ev["id_event"]] = (not swapped, player if player is not None else filled)
+    events.loc[ev.name, ["event_team", "opponent"]] = [ev["opponent"], ev["event_team"]]
+    if player is not None:
+        events.loc[ev.name, "player"] = player
 
-    for pl_full in players_from_events:
-        for potential_name_full in lineup:
-            pl, potential_name = pl_full.split(), potential_name_full.split()
 
-            if len(pl) > len(potential_name) and check_fit(pl, potential_name):
-                append_to_dictionary(set_to_lineup, pl_full, potential_name_full)
-                append_to_dictionary(lineup_to_set, potential_name_full, pl_full)
-            if len(pl) < len(potential_name) and check_fit(potential_name, pl):
-                append_to_dictionary(set_to_lineup, pl_full, potential_name_full)
-                append_to_dictionary(lineup_to_set, potential_name_full, pl_full)
+def save_corrections(path=CORRECTIONS_PATH):
+    frame = pd.DataFrame([(id_event, swap, player) for id_event, (swap, player) in corrections.items()],
+                         columns=CORRECTION_COLUMNS)
+    frame.to_csv(path, index=False)
+    save_frame(frame, "event_corrections")
+
+
+# with conflicts (batch mode) names that can't be paired are collected there instead of asking for input, dist_f
+# (called as distance.levenshtein with normalized=True) replaces the distances of the matcher
+def fit_rest_names(players_from_events, lineup, other_lineup, team, other_team, season, match_id, conflicts=None,
+                   dist_f=None):
+    # word matches and string distances come from the matcher (matcher.py), which keeps them between matches
+    set_to_lineup, lineup_to_set = matcher.word_matches(players_from_events, lineup, team, season)
 
     for pl in players_from_events:
-        dists = sorted([(dist_f(pl, candidate, normalized=True), candidate) for candidate in lineup])
+        if dist_f is None:
+            dists = matcher.ranking(pl, lineup, team, season)
+        else:
+            dists = sorted([(dist_f(pl, candidate, normalized=True), candidate) for candidate in lineup])
         if not resolve_match(pl, lineup, other_lineup, team, other_team, season, match_id, set_to_lineup, lineup_to_set,
                              dists):
+            if conflicts is not None:
+                print(f"CONFLICT DEFERRED: {pl} ({team}, {season})")
+                conflicts.setdefault((pl, team, season), (match_id, other_team, list(dists)))
+                continue
+
             print(f"Conflict detected!")
             print(team, "|", other_team, "|", match_id)
             print(f"{pl}: ")
@@ -185,74 +161,181 @@ def fit_rest_names(players_from_events, lineup, other_lineup, team, other_team,
     return False
 
 
-def build_player_name_translator(LEFT_AT=0):
+CANDIDATE = re.compile(r"(.*) \(([0-9.]+)\)$")
+
+
+def save_conflicts(conflicts, path=CONFLICTS_PATH):
+    rows = [(pl, team, season, match_id, other_team,
+             "; ".join(f"{candidate} ({score:.5f})" for score, candidate in dists), "")
+            for (pl, team, season), (match_id, other_team, dists) in conflicts.items()]
+    pd.DataFrame(rows, columns=["name", "team", "season", "match_id", "other_team", "candidates", "resolution"]) \
+        .to_csv(path, index=False)
+
+
+# conflicts saved by an interrupted batch run, the ones paired since then are left out
+def load_conflicts(path=CONFLICTS_PATH):
+    saved = pd.read_csv(path, dtype={"name": str, "team": str, "match_id": str, "other_team": str, "candidates": str},
+                        keep_default_na=False)
+    conflicts = {}
+    for pl, team, season, match_id, other_team, candidates in zip(
+            saved["name"], saved["team"], saved["season"], saved["match_id"], saved["other_team"],
+            saved["candidates"]):
+        if (pl, team, season) in valid_player_names:
+            continue
+        dists = [(float(m.group(2)), m.group(1)) for m in map(CANDIDATE.match, candidates.split("; ")) if m]
+        conflicts[(pl, team, season)] = (match_id or None, other_team or None, dists)
+    return conflicts
+
+
+def apply_resolutions(path=CONFLICTS_PATH):
+    resolutions = pd.read_csv(path, dtype={"name": str, "team": str, "resolution": str}, keep_default_na=False)
+    resolutions = resolutions.loc[resolutions["resolution"].str.strip() != ""]
+    for pl, team, season, cand in zip(resolutions["name"], resolutions["team"], resolutions["season"],
+                                      resolutions["resolution"]):
+        print(f"FOUND PAIRING BY RESOLUTION: {pl} -> {cand.strip()}")
+        valid_player_names[(pl, team, season)] = cand.strip()
+
+
+# pairs the names of one match, True when the input was finished with E
+def translate_match(ind, match, conflicts=None):
+    match_id = match['id_odsp']
+    home_team = match['ht']
+    away_team = match['at']
+    date = match['date']
+    season = match['season']
+
+    print(f"{home_team} vs {away_team} on {date} ({season})")
+
+    if not match["adv_stats"]:  # no data in events
+        print("No data available")
+        return False
+
+    lineup_pos = lineup_repo.find(date, home_team, away_team)
+    # duplicates are dropped by load_lineups
+    try:
+        assert lineup_pos is not None
+    except AssertionError as e:
+        print(ind)
+        raise e
+
+    home_lineup_db = lineup_repo.home_players(lineup_pos)
+    away_lineup_db = lineup_repo.away_players(lineup_pos)
+
+    # filter out nans
+    home_lineup = set(filter(lambda v: v == v, home_lineup_db))
+    away_lineup = set(filter(lambda v: v == v, away_lineup_db))
+
+    # Assumption: there are no two players of the same name
+    assert len(home_lineup) == len(list(filter(lambda v: v == v, home_lineup_db)))
+    assert len(away_lineup) == len(list(filter(lambda v: v == v, away_lineup_db)))
+
+    ht_player_set, at_player_set = match_players.sets(match_id)
+
+    ht_unmatched = filter_out_correct(ht_player_set, home_lineup, home_team, season)
+    at_unmatched = filter_out_correct(at_player_set, away_lineup, away_team, season)
+
+    # print(ht_unmatched)
+    # print(at_unmatched)
+    try:
+        return (fit_rest_names(ht_unmatched, home_lineup, away_lineup, home_team, away_team, season, match_id,
+                               conflicts) or
+                fit_rest_names(at_unmatched, away_lineup, home_lineup, away_team, home_team, season, match_id,
+                               conflicts))
+    except BaseException as e:
+        print(ind)
+        raise e
+
+
+def save_names(conflicts=None):
+    with open("valid_player_names.pkl", "wb") as f:
+        pickle.dump(valid_player_names, f)
+    save_mapping(valid_player_names, "valid_player_names")
+    save_corrections()
+    if conflicts is not None:
+        save_conflicts(conflicts)
+
+
+# batch=True runs over all matches without input(), conflicts go to CONFLICTS_PATH, a run with resolutions (the
+# reviewed file) starts from the pairings in it and leaves only the conflicts that are still unresolved
+# a run from LEFT_AT > 0 continues the saved one, with its pairings and (in batch mode) its conflicts
+def build_player_name_translator(LEFT_AT=0, batch=False, resolutions=None):
+    if LEFT_AT > 0 and os.path.exists("valid_player_names.pkl"):
+        valid_player_names.update(read_mapping("valid_player_names", "valid_player_names.pkl"))
+    if resolutions is not None:
+        apply_resolutions(resolutions)
+    conflicts = None
+    if batch:
+        conflicts = load_conflicts() if LEFT_AT > 0 and os.path.exists(CONFLICTS_PATH) else {}
+
     # temp_db = ginf.loc[ginf["league"] == "I1"].reset_index(drop=True)
 
     # for ind, match in temp_db.loc[LEFT_AT:].iterrows(): #tymczasowo dopóki nie ma całego lineups
     for ind, match in ginf.loc[LEFT_AT:].iterrows():
-        match_id = match['id_odsp']
-        home_team = match['ht']
-        away_team = match['at']
-        date = match['date']
-        season = match['season']
-
-        print(f"{home_team} vs {away_team} on {date} ({season})")
-
-        if not match["adv_stats"]:  # no data in events
-            print("No data available")
-            continue  # pass, continue, cokolwiek
-
-        lineup = lineups.loc[
-            (lineups['date'] == date) & (lineups['home_team'] == home_team) & (lineups['away_team'] == away_team)]
-        # no duplicates
-        try:
-            assert len(lineup) == 1
-        except AssertionError as e:
-            print(ind)
-            raise e
-
-        home_lineup_db = lineup[[f"hp{i}" for i in range(1, 12)] + [f"hs{i}" for i in range(1, 13)]].values[0]
-        away_lineup_db = lineup[[f"ap{i}" for i in range(1, 12)] + [f"as{i}" for i in range(1, 13)]].values[0]
-
-        # filter out nans
-        home_lineup = set(filter(lambda v: v == v, home_lineup_db))
-        away_lineup = set(filter(lambda v: v == v, away_lineup_db))
-
-        # Assumption: there are no two players of the same name
-        assert len(home_lineup) == len(list(filter(lambda v: v == v, home_lineup_db)))
-        assert len(away_lineup) == len(list(filter(lambda v: v == v, away_lineup_db)))
-
-        evs_in_match = events.loc[events['id_odsp'] == match_id]
-        ht_player_set, at_player_set = set(), set()
-        for _, ev in evs_in_match.iterrows():
-            ev_team, op_team = ev['event_team'], ev['opponent']
-
-            if ev_team == home_team:
-                add_players_to_set(ev, ht_player_set, at_player_set)
-            else:
-                add_players_to_set(ev, at_player_set, ht_player_set)
-
-        ht_unmatched = filter_out_correct(ht_player_set, home_lineup, home_team, season)
-        at_unmatched = filter_out_correct(at_player_set, away_lineup, away_team, season)
-
-        # print(ht_unmatched)
-        # print(at_unmatched)
-        try:
-            if (fit_rest_names(ht_unmatched, home_lineup, away_lineup, home_team, away_team, season, match_id) or
-                    fit_rest_names(at_unmatched, away_lineup, home_lineup, away_team, home_team, season, match_id)):
-                with open("valid_player_names.pkl", "wb") as f:
-                    pickle.dump(valid_player_names, f)
-                return ind
-        except BaseException as e:
-            print(ind)
-            raise e
+        if translate_match(ind, match, conflicts):
+            save_names()
+            return ind
 
         if ind % 10 == 0:
-            with open("valid_player_names.pkl", "wb") as f:
-                pickle.dump(valid_player_names, f)
+            save_names(conflicts)
+
+    save_names(conflicts)
+    if conflicts is not None:
+        print(f"{len(conflicts)} conflicts saved to {CONFLICTS_PATH}")
+
+
+# a league never reads the pairings of another one (keys have the team, other_team is from the same match), so the
+# leagues are translated in batch mode by separate processes
+def translate_league(league):
+    conflicts = {}
+    for ind, match in ginf.loc[ginf["league"] == league].iterrows():
+        translate_match(ind, match, conflicts)
+    return league, valid_player_names, conflicts, {id_event: correction for id_event, correction in corrections.items()
+                                                   if loaded_corrections.get(id_event) != correction}
+
+
+# shards only share the pairings of the resolutions, a key paired differently by two leagues is reported and written
+# to the conflicts with both names as candidates, shards return only the corrections they changed
+def merge_shards(shards):
+    merged, conflicts, merged_corrections = {}, {}, dict(loaded_corrections)
+    for league, names, league_conflicts, league_corrections in shards:
+        merged_corrections.update(league_corrections)
+        for key, name in names.items():
+            if key in merged and merged[key] != name:
+                print(f"SHARD CONFLICT: {key} -> {merged[key]} / {name} ({league})")
+                conflicts.setdefault(key, (None, None, [(0.0, merged[key]), (0.0, name)]))
+            else:
+                merged.setdefault(key, name)
+        for key, conflict in league_conflicts.items():
+            conflicts.setdefault(key, conflict)
+    return merged, conflicts, merged_corrections
 
-    with open("valid_player_names.pkl", "wb") as f:
-        pickle.dump(valid_player_names, f)
 
+def build_parallel(n_jobs=os.cpu_count(), resolutions=None):
+    global valid_player_names, corrections
+    if resolutions is not None:
+        apply_resolutions(resolutions)
 
-build_player_name_translator()
+    leagues = list(ginf["league"].unique())
+    if n_jobs > 1:
+        with mp.get_context("fork").Pool(min(n_jobs, len(leagues))) as p:
+            shards = p.map(translate_league, leagues)
+    else:
+        shards = [translate_league(league) for league in leagues]
+
+    valid_player_names, conflicts, corrections = merge_shards(shards)
+    save_names(conflicts)
+    print(f"{len(conflicts)} conflicts saved to {CONFLICTS_PATH}")
+
+
+# python translator.py --batch [reviewed conflicts file], --parallel for the batch mode with a process per league,
+# --from <index of ginf> first continues a run that stopped there
+args = sys.argv[1:]
+LEFT_AT = 0
+if args[:1] == ["--from"]:
+    LEFT_AT, args = int(args[1]), args[2:]
+if args[:1] == ["--batch"]:
+    build_player_name_translator(LEFT_AT, batch=True, resolutions=args[1] if len(args) > 1 else None)
+elif args[:1] == ["--parallel"]:
+    build_parallel(resolutions=args[1] if len(args) > 1 else None)
+else:
+    build_player_name_translator(LEFT_AT)
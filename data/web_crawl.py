@@ -5,17 +5,74 @@ import numpy as np
 import pandas as pd
 import re
 import pickle
+import os
+import sys
+import multiprocessing as mp
+
+from dataset import DATASET_DIR, exists, save_frame, save_mapping, load_mapping
+from crawl_pool import FetchPool, RateLimiter, HttpFetcher
+from page_store import PageStore, PAGES_DIR
+from journal import CacheJournal, read_journal
 
 from selenium import webdriver
 
-chrome_options = webdriver.ChromeOptions()
-chrome_options.add_argument('--headless')
-chrome_options.add_argument('--no-sandbox')
-chrome_options.add_argument('--disable-dev-shm-usage')
 
-wd = webdriver.Chrome('chromedriver', options=chrome_options)
+def new_driver():
+    chrome_options = webdriver.ChromeOptions()
+    chrome_options.add_argument('--headless')
+    chrome_options.add_argument('--no-sandbox')
+    chrome_options.add_argument('--disable-dev-shm-usage')
+    return webdriver.Chrome('chromedriver', options=chrome_options)
+
+
+# the browser is started on first use, so the module can be imported (and SITE pointed at a local server) without it
+wd = None
+
+
+def driver():
+    global wd
+    if wd is None:
+        wd = new_driver()
+    return wd
+
+
+# fetcher of FetchPool, every worker drives its own browser, pages are written to store like HttpFetcher does (a
+# browser can't make conditional requests, so there are no validators)
+class BrowserFetcher:
+    def __init__(self, render_delay=2, store=None):
+        self.wd = new_driver()
+        self.render_delay = render_delay
+        self.store = store
+
+    def __call__(self, url):
+        self.wd.get(url)
+        sleep(self.render_delay)
+        html = self.wd.page_source
+        if self.store is not None:
+            self.store.put(url, html)
+        return html
+
+    def close(self):
+        self.wd.quit()
+
 
 SITE = "https://int.soccerway.com"
+# seconds between two requests to the same host for pages fetched without the browser
+REQUEST_INTERVAL = 2
+# a pool of n workers shares REQUEST_INTERVAL between them (requests are REQUEST_INTERVAL / n apart), but the host
+# never gets more than one request per MIN_POOL_INTERVAL seconds, more workers than that allows fetch no faster
+MIN_POOL_INTERVAL = 0.5
+# parser of the pages fetched without the browser
+PARSER = "lxml"
+
+# league, match and player pages don't need JavaScript, they are fetched over plain HTTP, the browser is only
+# used for the season pages where rounds are switched in the dropdown
+http = None
+limiter = RateLimiter(REQUEST_INTERVAL)
+# raw html of every page fetched over HTTP (page_store.py), a stored page is read from disk instead of the site until
+# it is PAGE_TTL seconds old, then the site is asked whether it has changed
+pages = None
+PAGE_TTL = 30 * 24 * 60 * 60
 pos_translator = {"Goalkeeper": 1, "Bramkarz": 1,
                   "Defender": 2, "Obrońca": 2,
                   "Midfielder": 3, "Pomocnik": 3,
@@ -99,61 +156,267 @@ def pickle_save(path, ob):
         pickle.dump(ob, f)
 
 
+CACHE_MAPS = ["player_stats", "player_pos", "url_to_name", "name_to_url", "visited", "missing_data", "table_pos"]
+
+# why a match is in missing_data, entries saved before the reasons were kept have UNKNOWN_REASON
+NO_LINEUP, WRONG_COUNT, TOO_MANY_SUBS, UNKNOWN_REASON = "no_lineup", "wrong_count", "too_many_subs", "unknown"
+
+
+# missing_data used to be a list of (home_team, away_team, season), now it maps them to the reason
+def missing_data_from(saved):
+    if isinstance(saved, dict):
+        return saved
+    return dict.fromkeys(saved, UNKNOWN_REASON)
+
+
 class Cache:
     def __init__(self, drive_root=""):
         self.player_stats = {}
         self.player_pos = {}
         self.url_to_name = {}
         self.name_to_url = {}
-        self.missing_data = []
+        self.missing_data = {}
         self.visited = set()
         self.table_pos = {}
+        # player urls parsed by this crawl that get_player_data hasn't named yet, not saved
+        self.fetched = set()
 
         self.drive_root = drive_root
+        self.journal = None
 
-    def save_cache(self):
-        pickle_save(self.drive_root + "player_stats.pkl", self.player_stats)
-        pickle_save(self.drive_root + "player_pos.pkl", self.player_pos)
-        pickle_save(self.drive_root + "url_to_name.pkl", self.url_to_name)
-        pickle_save(self.drive_root + "name_to_url.pkl", self.name_to_url)
-        pickle_save(self.drive_root + "visited.pkl", self.visited)
-        pickle_save(self.drive_root + "missing_data.pkl", self.missing_data)
-        pickle_save(self.drive_root + "table_pos.pkl", self.table_pos)
+    # changes are written to the journal (journal.py) when the crawl saves its state
+    def log(self, name, key=None, value=None):
+        if self.journal is not None:
+            self.journal.append(name, key, value)
+
+    def copy(self):
+        c = Cache(self.drive_root)
+        for name in CACHE_MAPS:
+            setattr(c, name, getattr(self, name).copy())
+        return c
+
+    # maps of the cache are saved to the dataset (dataset.py), pickles are only read when there is no dataset yet
+    def save_cache(self, root=DATASET_DIR):
+        for name in CACHE_MAPS:
+            save_mapping(getattr(self, name), name, os.path.join(self.drive_root, root))
 
     def save_backup(self):
-        pickle_save(self.drive_root + "player_stats_bkp.pkl", self.player_stats)
-        pickle_save(self.drive_root + "player_pos_bkp.pkl", self.player_pos)
-        pickle_save(self.drive_root + "url_to_name_bkp.pkl", self.url_to_name)
-        pickle_save(self.drive_root + "name_to_url_bkp.pkl", self.name_to_url)
-        pickle_save(self.drive_root + "visited_bkp.pkl", self.visited)
-        pickle_save(self.drive_root + "missing_data_bkp.pkl", self.missing_data)
-        pickle_save(self.drive_root + "table_pos_bkp.pkl", self.table_pos)
+        self.save_cache(DATASET_DIR + "_bkp")
 
     @staticmethod
     def load_cache(drive_root=""):
         c = Cache(drive_root)
+        root = os.path.join(c.drive_root, DATASET_DIR)
 
-        c.player_stats = pickle_load(c.drive_root + "player_stats.pkl")
-        c.player_pos = pickle_load(c.drive_root + "player_pos.pkl")
-        c.url_to_name = pickle_load(c.drive_root + "url_to_name.pkl")
-        c.name_to_url = pickle_load(c.drive_root + "name_to_url.pkl")
-        c.visited = pickle_load(c.drive_root + "visited.pkl")
-        c.missing_data = pickle_load(c.drive_root + "missing_data.pkl")
-        c.table_pos = pickle_load(c.drive_root + "table_pos.pkl")
+        for name in CACHE_MAPS:
+            if exists(name, root):
+                setattr(c, name, load_mapping(name, root))
+            else:
+                setattr(c, name, pickle_load(c.drive_root + f"{name}.pkl"))
+        c.missing_data = missing_data_from(c.missing_data)
 
         return c
 
 
+# lineups of the crawl, new rows are kept in a list and the frame is only built when it is saved, crawled matches
+# are looked up by (season, home_team, away_team) instead of masks over the whole frame
+class LineupBuffer:
+    def __init__(self, frame):
+        self.frame = frame
+        self.rows = []
+        self.crawled = set(zip(frame["season"], frame["home_team"], frame["away_team"]))
+
+    def __contains__(self, key):
+        return key in self.crawled
+
+    def __len__(self):
+        return len(self.frame) + len(self.rows)
+
+    def append(self, row):
+        self.rows.append(row)
+        self.crawled.add((row[0], row[2], row[26]))
+
+    def drop(self, keys):
+        keys = set(keys)
+        frame = self.to_frame()
+        crawled = pd.Series(list(zip(frame["season"], frame["home_team"], frame["away_team"])), dtype=object)
+        self.frame = frame.loc[~crawled.isin(keys).values].reset_index(drop=True)
+        self.crawled -= keys
+
+    # the returned frame is never edited in place, so it can be saved while the crawl goes on
+    def to_frame(self):
+        if self.rows:
+            new = pd.DataFrame(self.rows, columns=self.frame.columns)
+            self.frame = new if len(self.frame) == 0 else pd.concat([self.frame, new], ignore_index=True)
+            self.rows = []
+        return self.frame
+
+
+def add_lineup(cache, lineups, row):
+    lineups.append(row)
+    cache.log("lineups", value=row)
+
+
+# changes of a previous run that are in the journal but not in the saved state
+def replay_journal(cache, lineups):
+    for name, key, value in read_journal(os.path.join(cache.drive_root, DATASET_DIR)):
+        if name == "lineups":
+            if (value[0], value[2], value[26]) not in lineups:
+                lineups.append(value)
+        elif name == "visited":
+            cache.visited.add(key)
+        elif name == "missing_data":
+            cache.missing_data[key] = UNKNOWN_REASON if value is None else value
+        elif name == "name_to_url" and value is None:
+            cache.name_to_url.pop(key, None)
+        else:
+            getattr(cache, name)[key] = value
+
+
+# matches that failed for one of the reasons are forgotten, so the next crawl visits them again
+def forget_missing(cache, lineups, reasons):
+    keys = [key for key, reason in cache.missing_data.items() if reason in reasons]
+    for key in keys:
+        del cache.missing_data[key]
+    lineups.drop([(season, home_team, away_team) for home_team, away_team, season in keys])
+    return keys
+
+
+# the state is saved from copies in the background, changes made meanwhile stay in the journal
+def checkpoint(cache, lineups):
+    state, rows = cache.copy(), lineups.to_frame()
+
+    def save():
+        state.save_cache()
+        rows.to_csv("lineups.csv", index=False)
+        save_frame(rows, "lineups")
+
+    cache.journal.checkpoint(save)
+
+
 def get_data(link, verbose=True, delay=10):
     if verbose:
         print(f"visiting {link}")
 
-    wd.get(link)
+    driver().get(link)
     sleep(delay)
-    soup = BeautifulSoup(wd.page_source, 'html.parser')
+    soup = BeautifulSoup(driver().page_source, 'html.parser')
     return soup
 
 
+def page_store():
+    global pages
+    if pages is None:
+        pages = PageStore(PAGES_DIR)
+    return pages
+
+
+def get_page(link, verbose=True):
+    global http
+    if page_store().fresh(link, PAGE_TTL):
+        return BeautifulSoup(page_store().get(link), PARSER)
+
+    if http is None:
+        http = HttpFetcher(store=page_store())
+    limiter.wait(link)
+    if verbose:
+        print(f"visiting {link}")
+    return BeautifulSoup(http(link), PARSER)
+
+
+# (url, html) of the fresh stored pages, then of the rest as the pool fetches them, the fetchers of the pool are made
+# with store=page_store()
+def get_pages(pool, links):
+    missing = []
+    for link in links:
+        if page_store().fresh(link, PAGE_TTL):
+            yield link, page_store().get(link)
+        else:
+            missing.append(link)
+    yield from pool.fetch_all(missing)
+
+
+def _parse_stored(job):
+    parse, url = job
+    return url, parse(BeautifulSoup(page_store().get(url), PARSER))
+
+
+# parses all stored pages under SITE + prefix again, without the network
+def reparse(parse, prefix, n_jobs=1):
+    jobs = [(parse, url) for url in page_store().urls(SITE + prefix)]
+    if n_jobs > 1:
+        with mp.get_context("fork").Pool(n_jobs) as p:
+            return dict(p.imap(_parse_stored, jobs, chunksize=16))
+    return dict(map(_parse_stored, jobs))
+
+
+# player data of the cache refreshed from the stored player pages, e.g. after parse_player was changed
+def reparse_players(cache, n_jobs=os.cpu_count()):
+    for url, player in reparse(parse_player, "/players/", n_jobs).items():
+        record_player(cache, url[len(SITE):], *player)
+
+
+def parse_player(player_soup):
+    try:
+        weight = int(player_soup.find("dd", {"data-weight": "weight"}).text.split()[0])
+    except AttributeError:
+        weight = np.nan
+    try:
+        height = int(player_soup.find("dd", {"data-height": "height"}).text.split()[0])
+    except AttributeError:
+        height = np.nan
+    try:
+        pos = player_soup.find("dd", {"data-position": "position"}).text
+    except AttributeError:
+        pos = "Defender"
+
+    name = unidecode(re.search(r"(?<= - ).+(?= - Profil)", player_soup.title.text).group(0)).lower()
+    if len(name.split()[0]) == 2 and name.split()[0][1] == ".":
+
+        first_name = None
+        first_names = unidecode(player_soup.find("dd", {"data-first_name": "first_name"}).text).lower().split()
+        matching_letter = name.split()[0][0].lower()
+
+        for poss_name in first_names:
+            if poss_name[0] == matching_letter and first_name is None:
+                first_name = poss_name
+
+        if first_name is None:
+            first_name = first_names[0]
+
+        surname = unidecode(player_soup.find("dd", {"data-last_name": "last_name"}).text).lower()
+        name = f"{first_name} {surname}".lower()
+    else:
+        first_names = unidecode(player_soup.find("dd", {"data-first_name": "first_name"}).text).lower().split()
+        surnames = unidecode(player_soup.find("dd", {"data-last_name": "last_name"}).text).lower().split()
+
+        if name == surnames[0]:
+            name = first_names[0] + " " + name
+
+    return name, weight, height, pos
+
+
+# a url parsed again under another name (reparse_players) moves its name_to_url keys to the new name, a removed key is
+# journaled with None
+def record_player(cache, url, name, weight, height, pos):
+    old_name = cache.url_to_name.get(url)
+    if old_name is not None and old_name != name:
+        for key in [key for key, value in cache.name_to_url.items() if key[0] == old_name and value == url]:
+            del cache.name_to_url[key]
+            cache.log("name_to_url", key, None)
+            if cache.name_to_url.get((name,) + key[1:]) is None:
+                cache.name_to_url[(name,) + key[1:]] = url
+                cache.log("name_to_url", (name,) + key[1:], url)
+    cache.url_to_name[url] = name
+    cache.player_stats[url] = [weight, height]
+    cache.player_pos[url] = pos
+    cache.visited.add(url)
+    cache.log("url_to_name", url, name)
+    cache.log("player_stats", url, [weight, height])
+    cache.log("player_pos", url, pos)
+    cache.log("visited", url)
+
+
 def get_player_data(cache, url, season, team, with_pos=False, verbose=True):
     if url == "/players/roel-brouwers/16901/":  # roel brouwers has two urls
         if with_pos:
@@ -161,91 +424,76 @@ def get_player_data(cache, url, season, team, with_pos=False, verbose=True):
         return "roel brouwers"
 
     if url not in cache.visited:
-        player_soup = get_data(SITE + url, verbose=verbose)
-
-        try:
-            weight = int(player_soup.find("dd", {"data-weight": "weight"}).text.split()[0])
-        except AttributeError:
-            weight = np.nan
-        try:
-            height = int(player_soup.find("dd", {"data-height": "height"}).text.split()[0])
-        except AttributeError:
-            height = np.nan
-        try:
-            pos = player_soup.find("dd", {"data-position": "position"}).text
-        except AttributeError:
-            pos = "Defender"
-
-        name = unidecode(re.search(r"(?<= - ).+(?= - Profil)", wd.title).group(0)).lower()
-        if len(name.split()[0]) == 2 and name.split()[0][1] == ".":
-
-            first_name = None
-            first_names = unidecode(player_soup.find("dd", {"data-first_name": "first_name"}).text).lower().split()
-            matching_letter = name.split()[0][0].lower()
-
-            for poss_name in first_names:
-                if poss_name[0] == matching_letter and first_name is None:
-                    first_name = poss_name
-
-            if first_name is None:
-                first_name = first_names[0]
-
-            surname = unidecode(player_soup.find("dd", {"data-last_name": "last_name"}).text).lower()
-            name = f"{first_name} {surname}".lower()
-        else:
-            first_names = unidecode(player_soup.find("dd", {"data-first_name": "first_name"}).text).lower().split()
-            surnames = unidecode(player_soup.find("dd", {"data-last_name": "last_name"}).text).lower().split()
-
-            if name == surnames[0]:
-                name = first_names[0] + " " + name
-
-        cache.url_to_name[url] = name
-
-        assert cache.name_to_url.get((name, season, team)) is None
-        cache.name_to_url[(name, season, team)] = url
-
-        cache.player_stats[url] = [weight, height]
-        cache.player_pos[url] = pos
-        cache.visited.add(url)
+        record_player(cache, url, *parse_player(get_page(SITE + url, verbose=verbose)))
+        cache.fetched.add(url)
 
     name = cache.url_to_name[url]
+    # the first name of a url parsed by this crawl (here or by the pool) can't be taken by another url
+    if url in cache.fetched:
+        cache.fetched.discard(url)
+        assert cache.name_to_url.get((name, season, team)) is None
     if cache.name_to_url.get((name, season, team)) is None:
         cache.name_to_url[(name, season, team)] = url
+        cache.log("name_to_url", (name, season, team), url)
 
     if with_pos:
         return pos_translator[cache.player_pos[url]], name
     return name
 
 
-def failed_load(cache, home_team, away_team, season, date, lineups, verbose=True):
-    cache.missing_data.append((home_team, away_team, season))
-    row = [season, date, home_team] + [np.NaN] * 23 + [away_team] + [np.NaN] * 23
+def failed_load(cache, home_team, away_team, season, date, lineups, reason, verbose=True):
+    cache.missing_data[(home_team, away_team, season)] = reason
+    cache.log("missing_data", (home_team, away_team, season), reason)
+    row = [season, date, home_team] + [np.nan] * 23 + [away_team] + [np.nan] * 23
     if verbose:
-        print(f"COULD NOT FIND INFO ABOUT: {home_team} - {away_team} ({season})")
-    lineups.loc[len(lineups)] = row
+        print(f"COULD NOT FIND INFO ABOUT: {home_team} - {away_team} ({season}), {reason}")
+    add_lineup(cache, lineups, row)
     return row
 
 
-def get_lineup(cache, home_team, away_team, season, match_soup, lineups, verbose=True):
-    day, month, year = match_soup.find("div", {"class": "details"}).a.text.split("/")
-    date = f"{year}-{month}-{day}"
-
+# links of the first XI (with the coach as the 12th link) and of the subs, None when the page has no lineup
+def lineup_links(match_soup):
     try:
         home_links = match_soup.find_all("div", {"class": "combined-lineups-container"})[0].find("div", {
             "class": "container left"}).find_all("a", href=True)
         away_links = match_soup.find_all("div", {"class": "combined-lineups-container"})[0].find("div", {
             "class": "container right"}).find_all("a", href=True)
     except IndexError:  # No lineup available
-        return failed_load(cache, home_team, away_team, season, date, lineups, verbose=verbose)
+        return None
     if len(home_links) != 12 or len(away_links) != 12:
-        return failed_load(cache, home_team, away_team, season, date, lineups, verbose=verbose)
+        return home_links, away_links, [], []
 
     home_subs = match_soup.find_all("div", {"class": "combined-lineups-container"})[1].find("div", {
         "class": "container left"}).find_all("a", href=True, class_=True)
     away_subs = match_soup.find_all("div", {"class": "combined-lineups-container"})[1].find("div", {
         "class": "container right"}).find_all("a", href=True, class_=True)
+    return home_links, away_links, home_subs, away_subs
+
+
+# player pages the lineup of the match would visit
+def lineup_player_urls(match_soup):
+    links = lineup_links(match_soup)
+    if links is None:
+        return []
+    home_links, away_links, home_subs, away_subs = links
+    if len(home_links) != 12 or len(away_links) != 12 or len(home_subs) > 12 or len(away_subs) > 12:
+        return []
+    return [link['href'] for link in home_links[:-1] + away_links[:-1] + home_subs + away_subs]
+
+
+def get_lineup(cache, home_team, away_team, season, match_soup, lineups, verbose=True):
+    day, month, year = match_soup.find("div", {"class": "details"}).a.text.split("/")
+    date = f"{year}-{month}-{day}"
+
+    links = lineup_links(match_soup)
+    if links is None:
+        return failed_load(cache, home_team, away_team, season, date, lineups, NO_LINEUP, verbose=verbose)
+    home_links, away_links, home_subs, away_subs = links
+    if len(home_links) != 12 or len(away_links) != 12:
+        return failed_load(cache, home_team, away_team, season, date, lineups, WRONG_COUNT, verbose=verbose)
+
     if len(home_subs) > 12 or len(away_subs) > 12:
-        return failed_load(cache, home_team, away_team, season, date, lineups, verbose=verbose)
+        return failed_load(cache, home_team, away_team, season, date, lineups, TOO_MANY_SUBS, verbose=verbose)
 
     home_subs_with_pos = sorted(
         [get_player_data(cache, link['href'], season, home_team, True, verbose) for link in home_subs])
@@ -257,14 +505,14 @@ def get_lineup(cache, home_team, away_team, season, match_soup, lineups, verbose
     away_players = [get_player_data(cache, link['href'], season, away_team, verbose=verbose) for link in
                     away_links[:-1]] + [sub for _, sub in away_subs_with_pos]
 
-    row = [season, date, home_team] + home_players + [np.NaN] * (23 - len(home_players)) + [
-        away_team] + away_players + [np.NaN] * (23 - len(away_players))
-    lineups.loc[len(lineups)] = row
+    row = [season, date, home_team] + home_players + [np.nan] * (23 - len(home_players)) + [
+        away_team] + away_players + [np.nan] * (23 - len(away_players))
+    add_lineup(cache, lineups, row)
     return row
 
 
-def all_games_from_season(cache, season_url, season, lineups, verbose=True):
-    global wd
+def all_games_from_season(cache, season_url, season, lineups, verbose=True, pool=None):
+    wd = driver()
     season_soup = get_data(season_url, verbose=verbose)
 
     for test in season_soup.find("table", {
@@ -278,6 +526,7 @@ def all_games_from_season(cache, season_url, season, lineups, verbose=True):
             raise KeyError
         print(f"added {name} : {rank}")
         cache.table_pos[(name, season)] = rank
+        cache.log("table_pos", (name, season), rank)
 
     rounds = wd.find_element_by_xpath(
         '//*[@id="page_competition_1_block_competition_matches_summary_11_page_dropdown"]')
@@ -300,8 +549,7 @@ def all_games_from_season(cache, season_url, season, lineups, verbose=True):
                 away_team = soccerway_to_kaggle_team_names.get(away_team, away_team)
 
                 # if not visited
-                if len(lineups.loc[(lineups['season'] == season) & (lineups['home_team'] == home_team) & (
-                        lineups['away_team'] == away_team)]) == 0:
+                if (season, home_team, away_team) not in lineups:
                     links.append((SITE + link['href'], home_team, away_team, round))
 
         prev_elem = wd.find_element_by_xpath(
@@ -309,6 +557,17 @@ def all_games_from_season(cache, season_url, season, lineups, verbose=True):
         wd.execute_script("arguments[0].click();", prev_elem)
         sleep(6)
 
+    match_soups = {}
+    if pool is not None:
+        # match pages first, then the pages of all players in them, parsed and merged into the cache here
+        to_fetch = [link for link, ht, at, _ in links if (ht, at, season) not in cache.missing_data]
+        match_soups = {link: BeautifulSoup(html, PARSER) for link, html in get_pages(pool, to_fetch)}
+        player_urls = [url for soup in match_soups.values() for url in lineup_player_urls(soup)
+                       if url not in cache.visited and url != "/players/roel-brouwers/16901/"]
+        for url, html in get_pages(pool, [SITE + url for url in player_urls]):
+            record_player(cache, url[len(SITE):], *parse_player(BeautifulSoup(html, PARSER)))
+            cache.fetched.add(url[len(SITE):])
+
     visited_rounds = set()
     for link, ht, at, round in links:
         if verbose:
@@ -317,11 +576,11 @@ def all_games_from_season(cache, season_url, season, lineups, verbose=True):
                 print(f"===== ROUND {round} =====")
             print(f"{ht} - {at}")
         if (ht, at, season) not in cache.missing_data:
-            match_soup = get_data(link, verbose=True)
+            match_soup = match_soups[link] if link in match_soups else get_page(link, verbose=True)
             get_lineup(cache, ht, at, season, match_soup, lineups, verbose=True)
 
 
-def all_seasons_of_league(cache, league_soup, lineups, verbose=True, save=True):
+def all_seasons_of_league(cache, league_soup, lineups, verbose=True, save=True, pool=None):
     start_year, end_year = 2011, 2017
     for season in range(start_year, end_year + 1):
         season_text = f"{season - 1}/{season}"
@@ -331,11 +590,10 @@ def all_seasons_of_league(cache, league_soup, lineups, verbose=True, save=True):
         if verbose:
             print(f"========== {season_text} ==========")
 
-        all_games_from_season(cache, SITE + link['href'], season, lineups, True)
+        all_games_from_season(cache, SITE + link['href'], season, lineups, True, pool=pool)
 
         if save:
-            cache.save_cache()
-            lineups.to_csv("lineups.csv", index=False)
+            checkpoint(cache, lineups)
 
 
 leagues = [
@@ -346,29 +604,70 @@ leagues = [
     ("Bundesliga", "https://int.soccerway.com/national/germany/bundesliga/c9/archive/", "bundesliga")]
 
 
-def crawl(verbose=True, start_new=False, save=True):
+# spacing of the requests of a pool of n_workers to the same host
+def pool_interval(request_interval, n_workers):
+    return max(request_interval / n_workers, min(MIN_POOL_INTERVAL, request_interval))
+
+
+# with n_workers > 1 match and player pages are fetched by that many HTTP sessions (browsers with browser=True) at once,
+# requests of the pool are pool_interval apart, or request_interval apart in every worker with per_worker
+# matches in missing_data for one of the reasons in retry are crawled again, with reparse the players are refreshed from
+# the stored pages (reparse_players) instead of crawling, the page index is compacted when the crawl stops
+def crawl(verbose=True, start_new=False, save=True, n_workers=1, retry=(), browser=False,
+          request_interval=REQUEST_INTERVAL, per_worker=False, reparse=False):
     if start_new:
         cache = Cache()
         player_names = [f"{first_xi}{no}" for first_xi in ["p", "s"] for no in range(1, 12)] + ["s12"]
-        lineups = pd.DataFrame(columns=["season", "date", "home_team"] + [f"h{player}" for player in player_names] +
-                                       ["away_team"] + [f"a{player}" for player in player_names])
+        lineups = LineupBuffer(pd.DataFrame(
+            columns=["season", "date", "home_team"] + [f"h{player}" for player in player_names] + ["away_team"] +
+                    [f"a{player}" for player in player_names]))
     else:
         cache = Cache.load_cache()
-        lineups = pd.read_csv("../lineups.csv")
+        lineups = LineupBuffer(pd.read_csv("../lineups.csv"))
+    limiter.min_interval = request_interval
+    pool = None
+    if n_workers > 1:
+        fetcher = BrowserFetcher if browser else HttpFetcher
+        pool_limiter = RateLimiter(request_interval if per_worker else pool_interval(request_interval, n_workers))
+        pool = FetchPool(lambda: fetcher(store=page_store()), n_workers, pool_limiter, verbose, per_worker)
+    if save:
+        cache.journal = CacheJournal(os.path.join(cache.drive_root, DATASET_DIR), fresh=start_new)
+        if not start_new:
+            replay_journal(cache, lineups)
+    if retry and forget_missing(cache, lineups, retry) and save:
+        checkpoint(cache, lineups)
 
     try:
+        if reparse:
+            reparse_players(cache)
+            if save:
+                checkpoint(cache, lineups)
+            return
+
         for league_name, league_url, league_code in leagues:
             if verbose:
                 print(f"=============== {league_name} ===============")
-            league_soup = get_data(league_url, verbose=verbose)
-            all_seasons_of_league(cache, league_soup, lineups, verbose=verbose, save=save)
+            league_soup = get_page(league_url, verbose=verbose)
+            all_seasons_of_league(cache, league_soup, lineups, verbose=verbose, save=save, pool=pool)
         return
 
     except BaseException as e:
         # cache.save_cache()
         # lineups.to_pickle(DRIVE_ROOT + "lineups.pkl")
-        print(wd.current_url)
+        if wd is not None:
+            print(wd.current_url)
         raise e
 
+    finally:
+        if cache.journal is not None:
+            cache.journal.close()
+        if pages is not None:
+            pages.compact()
 
-crawl(start_new=False, save=False)
+
+# python web_crawl.py --reparse refreshes the saved players from the stored pages
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--reparse":
+        crawl(reparse=True)
+    else:
+        crawl(start_new=False, save=False)
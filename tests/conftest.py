@@ -0,0 +1,42 @@
+import functools
+import os
+import sys
+import threading
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+
+import pytest
+
+# the modules of data/ import each other by their top-level names, the same as when they are run from data/
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data"))
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+
+# answers are not printed, their (path, status) are kept in server.log
+class QuietHandler(SimpleHTTPRequestHandler):
+    def log_request(self, code="-", size="-"):
+        self.server.log.append((self.path, int(code)))
+
+    def log_message(self, *args):
+        pass
+
+
+# saved soccerway pages served over HTTP
+@pytest.fixture
+def soccerway_server():
+    handler = functools.partial(QuietHandler, directory=os.path.join(FIXTURES, "soccerway"))
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    server.log = []
+    thread = threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True)
+    thread.start()
+    try:
+        yield server
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+# the base url stands in for web_crawl.SITE
+@pytest.fixture
+def soccerway(soccerway_server):
+    return f"http://127.0.0.1:{soccerway_server.server_address[1]}"
@@ -0,0 +1,52 @@
+import numpy as np
+import pandas as pd
+
+from codes import code_teams, team_dtype, memory_usage, print_memory_usage
+
+
+def frames():
+    ginf = pd.DataFrame({"id_odsp": ["m1", "m2"], "ht": ["Roma", "Lazio"], "at": ["Lazio", "Milan"]})
+    events = pd.DataFrame({"id_odsp": ["m1", "m1", "m2"], "event_team": ["Roma", "Lazio", np.nan],
+                           "opponent": ["Lazio", "Roma", "Lazio"]})
+    lineups = pd.DataFrame({"home_team": ["Roma", "Lazio"], "away_team": ["Lazio", "Napoli"]})
+    return {"ginf": ginf, "events": events, "lineups": lineups}
+
+
+def test_team_dtype_covers_all_columns():
+    dtype = team_dtype([pd.Series(["Roma", np.nan]), pd.Series(["Milan", "Roma"])])
+    assert list(dtype.categories) == ["Milan", "Roma"]
+
+
+def test_code_teams_replaces_strings_with_shared_codes():
+    data = frames()
+    dtype = code_teams(data)
+    ginf, events = data["ginf"], data["events"]
+    assert all(df[c].dtype == dtype for df, columns in [(ginf, ["ht", "at"]), (events, ["event_team", "opponent"]),
+                                                         (data["lineups"], ["home_team", "away_team"])]
+               for c in columns)
+
+    # masks and merges behave like they did on strings
+    assert list(ginf["ht"] == "Roma") == [True, False]
+    assert not (ginf["ht"] == "Juventus").any()
+    merged = events.merge(ginf, on="id_odsp")
+    assert list(merged["event_team"] == merged["ht"]) == [True, False, False]
+    assert events["event_team"].isna().tolist() == [False, False, True]
+    assert isinstance(ginf["ht"].values[0], str)
+
+
+def test_code_teams_with_given_dtype():
+    data = frames()
+    dtype = code_teams(data)
+    more = {"ginf": pd.DataFrame({"ht": ["Milan"], "at": ["Roma"]})}
+    assert code_teams(more, dtype) is dtype
+    assert more["ginf"]["ht"].cat.codes[0] == dtype.categories.get_loc("Milan")
+
+
+def test_memory_usage_of_coded_frames(capsys):
+    data = {"lineups": pd.DataFrame({"home_team": ["Roma", "Lazio"] * 100, "away_team": ["Lazio", "Napoli"] * 100})}
+    before = memory_usage(data)
+    code_teams(data)
+    after = memory_usage(data)
+    assert after["lineups"] < before["lineups"]
+    print_memory_usage(before, after)
+    assert capsys.readouterr().out.startswith("lineups")
@@ -0,0 +1,67 @@
+import threading
+import time
+
+import pytest
+import requests
+
+from crawl_pool import RateLimiter, FetchPool, HttpFetcher, fetch_static
+
+MATCH = "/matches/2013/09/15/italy/serie-a/roma/lazio/1/"
+PLAYERS = ["/players/marco-conti/100/", "/players/luca-costa/101/", "/players/andrea-giordano/102/",
+           "/players/marco-marino/200/", "/players/luca-greco/201/"]
+
+
+def test_rate_limiter_spaces_requests_per_host():
+    limiter = RateLimiter(0.05)
+    start = time.monotonic()
+    for _ in range(3):
+        limiter.wait("http://a.test/x")
+    limiter.wait("http://b.test/x")
+    # two waits on a.test, none for the first request to b.test
+    assert 0.1 <= time.monotonic() - start < 0.5
+
+
+@pytest.mark.parametrize("make_fetcher", [HttpFetcher, lambda: fetch_static])
+def test_fetch_all_returns_every_page_once(soccerway, make_fetcher):
+    pool = FetchPool(make_fetcher, n_workers=3, limiter=RateLimiter(0), verbose=False)
+    urls = [soccerway + url for url in PLAYERS + [MATCH]]
+    pages = dict(pool.fetch_all(urls + urls[:2]))
+
+    assert sorted(pages) == sorted(urls)
+    assert "Marco Conti - Profil" in pages[soccerway + PLAYERS[0]]
+    assert "combined-lineups-container" in pages[soccerway + MATCH]
+
+
+def test_fetch_all_raises_the_failed_page(soccerway):
+    pool = FetchPool(HttpFetcher, n_workers=2, limiter=RateLimiter(0), verbose=False)
+    with pytest.raises(requests.HTTPError):
+        list(pool.fetch_all([soccerway + PLAYERS[0], soccerway + "/players/nobody/1/"]))
+
+
+def test_every_worker_gets_its_own_fetcher_and_closes_it(soccerway):
+    made, closed = [], []
+
+    class Fetcher:
+        def __init__(self):
+            made.append(threading.get_ident())
+
+        def __call__(self, url):
+            time.sleep(0.02)
+            return fetch_static(url)
+
+        def close(self):
+            closed.append(threading.get_ident())
+
+    pool = FetchPool(Fetcher, n_workers=3, limiter=RateLimiter(0), verbose=False)
+    assert len(list(pool.fetch_all([soccerway + url for url in PLAYERS]))) == len(PLAYERS)
+    assert len(set(made)) == len(made) and sorted(made) == sorted(closed)
+
+
+@pytest.mark.parametrize("per_worker, least, most", [(False, 0.35, 1.0), (True, 0.0, 0.3)])
+def test_shared_or_per_worker_spacing(soccerway, per_worker, least, most):
+    pool = FetchPool(lambda: fetch_static, n_workers=5, limiter=RateLimiter(0.1), verbose=False,
+                     per_worker=per_worker)
+    start = time.monotonic()
+    assert len(list(pool.fetch_all([soccerway + url for url in PLAYERS]))) == len(PLAYERS)
+    # shared: 5 requests to one host 0.1 s apart, per worker: every worker makes its first request at once
+    assert least <= time.monotonic() - start < most
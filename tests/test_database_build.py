@@ -0,0 +1,235 @@
+import importlib.util
+import multiprocessing as mp
+import os
+import shutil
+import sys
+from datetime import date
+
+import pandas as pd
+import pytest
+
+from dataset import frame_to_mapping, save_mapping
+
+DATA = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data")
+# two leagues of five teams over two seasons, events with swapped teams (crossed sides), own goals, corners,
+# substitutions with injuries and matches without adv_stats in the seasons of 2014
+LEAGUE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "league")
+MAPPINGS = ["name_to_url", "url_to_name", "valid_player_names", "player_pos", "table_pos"]
+
+
+def copy_league(root, n_matches=None):
+    os.makedirs(root, exist_ok=True)
+    for name in ["events", "lineups"]:
+        shutil.copy(os.path.join(LEAGUE, f"{name}.csv"), root)
+    ginf = pd.read_csv(os.path.join(LEAGUE, "ginf.csv"))
+    (ginf if n_matches is None else ginf.iloc[:n_matches]).to_csv(os.path.join(root, "ginf.csv"), index=False)
+    for name in MAPPINGS:
+        mapping = frame_to_mapping(pd.read_csv(os.path.join(LEAGUE, f"{name}.csv")), name)
+        save_mapping(mapping, name, os.path.join(root, "dataset"))
+
+
+# database_build.py builds the tables and X.csv of the working directory when it is imported, the pool of build()
+# pickles its functions by module name
+def run_build(root):
+    cwd = os.getcwd()
+    os.chdir(root)
+    try:
+        spec = importlib.util.spec_from_file_location("database_build", os.path.join(DATA, "database_build.py"))
+        module = importlib.util.module_from_spec(spec)
+        sys.modules["database_build"] = module
+        spec.loader.exec_module(module)
+        return module
+    finally:
+        os.chdir(cwd)
+
+
+@pytest.fixture(scope="module")
+def built(tmp_path_factory):
+    root = str(tmp_path_factory.mktemp("full"))
+    copy_league(root)
+    m = run_build(root)
+    return m, root, {name: getattr(m, name).copy() for name in ["teams", "players", "goalkeepers"]}
+
+
+# stat tables of build() from empty stores, before time_played and days_without_injury are resolved
+def rebuild(m, n_jobs=1):
+    sys.modules["database_build"] = m
+    m.teams = m.ColumnarStore(m.t_cols, ["name", "season", "round"], len(m.t_cols) - m.TEAM_STAT_NUMBER)
+    m.players = m.ColumnarStore(m.p_cols, ["id", "season", "round"], len(m.p_cols) - m.PLAYER_STAT_NUMBER)
+    m.goalkeepers = m.ColumnarStore(m.g_cols, ["id", "season", "round"], len(m.g_cols) - m.GOALKEEPER_STAT_NUMBER)
+    m.team_round_cache, m.player_round_cache = {}, {}
+    m.build(n_jobs=n_jobs)
+    return m.teams, m.players, m.goalkeepers
+
+
+# team columns the event loop of match_stats used to count, the team is the one left by its find_name calls and the
+# round the one of the team the event was listed for, so an event moved to the other side only counts when both teams
+# play the same round
+def event_loop_team_rows(m, match, hm_round, aw_round):
+    ht, at, season = match["ht"], match["at"], match["season"]
+    pos = m.lineup_repo.find(match["date"], ht, at)
+    home_lineup, away_lineup = m.lineup_repo.home_players(pos), m.lineup_repo.away_players(pos)
+    rows = {(ht, hm_round): dict.fromkeys(m.t_cols[4:], 0), (at, aw_round): dict.fromkeys(m.t_cols[4:], 0)}
+    rows[(ht, hm_round)]["games_played"] = rows[(ht, hm_round)]["games_played_home"] = 1
+    rows[(at, aw_round)]["games_played"] = rows[(at, aw_round)]["games_played_away"] = 1
+
+    for _, ev in m.event_index.match(match["id_odsp"]).iterrows():
+        ev_team, op_team = ev["event_team"], ev["opponent"]
+        ev_hoa, op_hoa = ("home", "away") if ev_team == ht else ("away", "home")
+        ev_round, op_round = (hm_round, aw_round) if ev_team == ht else (aw_round, hm_round)
+        ev_lineup, op_lineup = (home_lineup, away_lineup) if ev_team == ht else (away_lineup, home_lineup)
+
+        if not m.isnull(ev["player"]):
+            if ev["event_type"] != 2 and ev["event_type2"] != 15:
+                _, ev_team, op_team, ev_lineup, op_lineup = m.find_name(ev["player"], ev_team, op_team, ev_lineup,
+                                                                        op_lineup, season)
+            else:
+                _, op_team, ev_team, op_lineup, ev_lineup = m.find_name(ev["player"], op_team, ev_team, op_lineup,
+                                                                        ev_lineup, season)
+        for column in ["player2", "player_in", "player_out"]:
+            if not m.isnull(ev[column]) and (column != "player2" or ev["event_type"] != 2):
+                _, ev_team, op_team, ev_lineup, op_lineup = m.find_name(ev[column], ev_team, op_team, ev_lineup,
+                                                                        op_lineup, season)
+
+        def add(team, rnd, column):
+            if (team, rnd) in rows:
+                rows[(team, rnd)][column] += 1
+
+        def shot():
+            add(ev_team, ev_round, "attempts(shots)")
+            if not m.isnull(ev["location"]) and ev["location"] != 19:
+                add(ev_team, ev_round, "shot_made_" + m.LOCATIONS_DICT[ev["location"]])
+                add(op_team, op_round, "shot_conceded_" + m.LOCATIONS_DICT[ev["location"]])
+            if not m.isnull(ev["situation"]):
+                add(ev_team, ev_round, m.SITUATIONS_DICT[ev["situation"]] + "_made")
+                add(op_team, op_round, m.SITUATIONS_DICT[ev["situation"]] + "_conceded")
+
+        if ev["is_goal"] == 1:
+            for team, rnd, column in [(ev_team, ev_round, "goal_scored"), (op_team, op_round, "goal_conceded")]:
+                add(team, rnd, column)
+                add(team, rnd, f"{column}_{ev_hoa if team == ev_team else op_hoa}")
+            shot()
+            if ev["event_type2"] == 15:
+                add(op_team, op_round, "own_goals")
+        if ev["event_type"] == 1:
+            shot()
+            if ev["shot_outcome"] == 1:
+                add(ev_team, ev_round, "shots_on_target")
+        elif ev["event_type"] == 2:
+            add(ev_team, ev_round, "corners_won")
+            add(op_team, op_round, "corners_conceded")
+        elif ev["event_type"] in (3, 4, 7, 9):
+            add(ev_team, ev_round, m.EVENTS_DICT[ev["event_type"]])
+        elif ev["event_type"] == 5:
+            add(ev_team, ev_round, "yellow_cards")
+            add(ev_team, ev_round, "red_cards")
+        elif ev["event_type"] == 6:
+            add(ev_team, ev_round, "red_cards")
+        elif ev["event_type"] == 8:
+            add(ev_team, ev_round, "free_kicks_won")
+            add(op_team, op_round, "free_kicks_conceded")
+        elif ev["event_type"] == 11:
+            add(ev_team, ev_round, "penalties_conceded")
+            add(op_team, op_round, "penalties_won")
+    return rows
+
+
+def test_team_counters_follow_the_event_loop(built):
+    m, _, tables = built
+    assert any(crossed for _, _, crossed in m.team_counters)
+    adv = m.ginf.loc[m.ginf["adv_stats"].astype(bool)]
+    assert ((m.events["event_type2"] == 15) & m.events["id_odsp"].isin(adv["id_odsp"])).any()
+
+    teams = tables["teams"].set_index(["name", "date"])
+    for _, match in adv.iterrows():
+        home, away = teams.loc[(match["ht"], match["date"])], teams.loc[(match["at"], match["date"])]
+        expected = event_loop_team_rows(m, match, home["round"], away["round"])
+        assert expected[(match["ht"], home["round"])] == home[m.t_cols[4:]].to_dict(), match["id_odsp"]
+        assert expected[(match["at"], away["round"])] == away[m.t_cols[4:]].to_dict(), match["id_odsp"]
+
+
+# update_time_played, applied to the rows of a table in the order of the lineup slots, a player listed twice shares
+# one row
+def per_row_time_played(df, first_xi):
+    columns = ["subs_in", "subs_out", "time_played", "has_played"]
+    state = {}
+    for i, key in enumerate(zip(df["id"], df["season"], df["round"])):
+        if key not in state:
+            state[key] = {c: df[c].values[i] for c in columns}
+            state[key]["carded"] = df["second_yellow_card"].values[i] == 1 or df["straight_red_card"].values[i] == 1
+        row, read = state[key], dict(state[key])
+        if read["subs_out"] != 0 and read["carded"]:
+            row["subs_out"] = 0
+        if read["subs_in"] == 0 and read["subs_out"] == 0 and first_xi[i]:
+            row["time_played"] = 90
+        elif read["subs_in"] != 0 and read["subs_out"] == 0:
+            row["time_played"] = 90 - read["time_played"]
+        if row["time_played"] != 0:
+            row["has_played"] = 1
+    keys = list(zip(df["id"], df["season"], df["round"]))
+    return pd.DataFrame({c: [state[key][c] for key in keys] for c in columns})
+
+
+# update_injuries, days carried from the previous round of the player
+def per_row_days_without_injury(df):
+    days = {}
+    for key in sorted(set(zip(df["id"], df["season"], df["round"])), key=lambda k: (k[0], k[1], k[2])):
+        row = df.loc[(df["id"] == key[0]) & (df["season"] == key[1]) & (df["round"] == key[2])].iloc[0]
+        if row["has_injured"] == 1:
+            days[key] = (0, row["date"])
+        elif key[2] == 1:
+            days[key] = (10000, row["date"])
+        else:
+            prev, prev_date = days[(key[0], key[1], key[2] - 1)]
+            days[key] = (10000 if prev == 10000 else
+                         prev + (date.fromisoformat(row["date"]) - date.fromisoformat(prev_date)).days, row["date"])
+    return [days[key][0] for key in zip(df["id"], df["season"], df["round"])]
+
+
+def test_time_played_and_injuries_follow_the_per_row_rules(built):
+    m = built[0]
+    _, players, goalkeepers = rebuild(m)
+    assert players.to_frame()["has_injured"].sum() > 0
+    for store in (players, goalkeepers):
+        first_xi = store.tags().astype(bool)
+        raw = store.to_frame()
+        resolved = m.resolve_time_played(raw.copy(), first_xi)
+        expected = per_row_time_played(raw, first_xi)
+        for c in expected.columns:
+            assert list(resolved[c]) == list(expected[c]), c
+        assert list(m.resolve_days_without_injury(resolved)["days_without_injury"]) == \
+            per_row_days_without_injury(resolved)
+
+
+# X.csv of the fixture league, the stat totals of the histories are exact sums (they don't depend on the order the
+# matches were added in)
+def test_features_match_the_expected_file(built):
+    with open(os.path.join(built[1], "X.csv"), "rb") as a, open(os.path.join(LEAGUE, "X.csv"), "rb") as b:
+        assert a.read() == b.read()
+
+
+@pytest.mark.skipif("fork" not in mp.get_all_start_methods(), reason="build() forks its workers")
+def test_parallel_build_matches_serial(built):
+    m = built[0]
+    serial = [store.to_frame() for store in rebuild(m, n_jobs=1)]
+    parallel = [store.to_frame() for store in rebuild(m, n_jobs=2)]
+    for a, b in zip(serial, parallel):
+        pd.testing.assert_frame_equal(a, b)
+
+
+# 60 ends the seasons of 2014, the new matches are appended to X.csv, 50 stops in a season of 2014 with matches
+# without adv_stats and the rows of 2014 are transformed again
+@pytest.mark.parametrize("n_matches, appended", [(60, True), (50, False)])
+def test_incremental_run_matches_full_run(built, tmp_path, n_matches, appended):
+    _, full_root, tables = built
+    root = str(tmp_path)
+    copy_league(root, n_matches)
+    run_build(root)
+    copy_league(root)
+    m = run_build(root)
+
+    assert m.incremental and m.built_rows == n_matches and m.dbuilder.kept_.all() == appended
+    for name in ["teams", "players", "goalkeepers"]:
+        pd.testing.assert_frame_equal(getattr(m, name), tables[name])
+    with open(os.path.join(root, "X.csv"), "rb") as a, open(os.path.join(full_root, "X.csv"), "rb") as b:
+        assert a.read() == b.read()
@@ -0,0 +1,40 @@
+import numpy as np
+import pandas as pd
+
+from dataset import save_frame, load_frame, read_frame, save_mapping, load_mapping, read_mapping
+
+
+def test_frame_round_trip(tmp_path):
+    frame = pd.DataFrame({"team": ["Roma", "Lazio", "Roma"], "player": ["totti", np.nan, "de rossi"],
+                          "season": [2013, 2013, 2014], "time": [90.0, np.nan, 45.5]})
+    save_frame(frame, "lineups", str(tmp_path))
+    loaded = load_frame("lineups", str(tmp_path))
+
+    # strings are stored dictionary-encoded but come back as the plain strings of read_csv, with NaN
+    assert not isinstance(loaded["team"].dtype, pd.CategoricalDtype)
+    assert loaded["player"][1] != loaded["player"][1]
+    pd.testing.assert_frame_equal(loaded, frame)
+    frame.to_csv(tmp_path / "lineups.csv", index=False)
+    pd.testing.assert_frame_equal(loaded, pd.read_csv(tmp_path / "lineups.csv"))
+
+
+def test_read_frame_falls_back_to_csv(tmp_path):
+    csv_path = tmp_path / "ginf.csv"
+    pd.DataFrame({"id_odsp": ["a", "b"], "season": [2013, 2014]}).to_csv(csv_path, index=False)
+    assert list(read_frame("ginf", str(csv_path), str(tmp_path))["id_odsp"]) == ["a", "b"]
+
+
+def test_mapping_round_trip(tmp_path):
+    root = str(tmp_path)
+    names = {("totti", "Roma", 2013): "francesco totti", ("klose", "Lazio", 2014): "miroslav klose"}
+    stats = {"/players/a/1/": [75, 180], "/players/b/2/": [80, 185]}
+    visited = {"/players/a/1/", "/players/b/2/"}
+    for name, mapping in [("valid_player_names", names), ("player_stats", stats), ("visited", visited)]:
+        save_mapping(mapping, name, root)
+        assert load_mapping(name, root) == mapping
+
+
+def test_read_mapping_falls_back_to_pickle(tmp_path):
+    pickle_path = tmp_path / "table_pos.pkl"
+    pd.to_pickle({("Roma", 2013): 2}, pickle_path)
+    assert read_mapping("table_pos", str(pickle_path), str(tmp_path)) == {("Roma", 2013): 2}
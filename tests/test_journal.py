@@ -0,0 +1,50 @@
+import threading
+
+import pytest
+
+from journal import CacheJournal, read_journal, segments
+
+
+def test_checkpoints_dont_wait_for_a_running_save(tmp_path):
+    journal = CacheJournal(str(tmp_path))
+    release, saved = threading.Event(), []
+
+    def saver(n):
+        def save():
+            if n == 1:
+                release.wait()
+            saved.append(n)
+        return save
+
+    journal.append("visited", "/players/a/1/")
+    journal.checkpoint(saver(1))
+    journal.append("visited", "/players/b/2/")
+    # the first save is still running, neither call blocks and only the last copy is saved after it
+    journal.checkpoint(saver(2))
+    journal.append("visited", "/players/c/3/")
+    journal.checkpoint(saver(3))
+    journal.append("visited", "/players/d/4/")
+    assert saved == []
+
+    release.set()
+    journal.close()
+    assert saved == [1, 3]
+    assert segments(str(tmp_path)) == [4]
+    assert list(read_journal(str(tmp_path))) == [("visited", "/players/d/4/", None)]
+
+
+@pytest.mark.filterwarnings("ignore::pytest.PytestUnhandledThreadExceptionWarning")
+def test_a_failed_save_keeps_the_segments(tmp_path):
+    journal = CacheJournal(str(tmp_path))
+    journal.append("visited", "/players/a/1/")
+
+    def fail():
+        raise OSError("disk full")
+
+    journal.checkpoint(fail)
+    journal.wait()
+    journal.append("visited", "/players/b/2/")
+    saved = []
+    journal.checkpoint(lambda: saved.append(True))
+    journal.close()
+    assert saved == [True] and segments(str(tmp_path)) == [3]
@@ -0,0 +1,26 @@
+import os
+
+import pandas as pd
+
+from loaders import EventIndex, load_match_players
+
+
+def test_match_players_follow_ginf(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    events = pd.DataFrame({"id_odsp": ["m1", "m1"], "event_type": [1, 1], "event_type2": [None, None],
+                           "event_team": ["Roma", "Lazio"], "player": ["totti", "klose"], "player2": [None, None],
+                           "player_in": [None, None], "player_out": [None, None]})
+    events.to_csv("events.csv", index=False)
+    ginf = pd.DataFrame({"id_odsp": ["m1"], "ht": ["Roma"], "at": ["Lazio"]})
+    ginf.to_csv("ginf.csv", index=False)
+    assert load_match_players(EventIndex(events), ginf).sets("m1") == ({"totti"}, {"klose"})
+
+    # the saved frame is used while nothing changed
+    assert load_match_players(EventIndex(events), ginf.iloc[0:0]).sets("m1") == ({"totti"}, {"klose"})
+
+    # home and away were mixed up in ginf
+    ginf = pd.DataFrame({"id_odsp": ["m1"], "ht": ["Lazio"], "at": ["Roma"]})
+    ginf.to_csv("ginf.csv", index=False)
+    saved = os.path.getmtime(os.path.join("dataset", "match_players.feather"))
+    os.utime("ginf.csv", (saved + 1, saved + 1))
+    assert load_match_players(EventIndex(events), ginf).sets("m1") == ({"klose"}, {"totti"})
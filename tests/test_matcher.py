@@ -0,0 +1,57 @@
+import random
+
+import distance
+
+from matcher import levenshtein, normalized, NameMatcher
+
+NAMES = ["marco conti", "marco marino", "conti", "m. conti", "paolo mancini", "pablo mancini", "mancini", "",
+         "francesco totti", "daniele de rossi", "de rossi", "kevin-prince boateng", "zażółć", "a", "ab", "ba"]
+
+
+def random_names(n, seed=0):
+    rng = random.Random(seed)
+    return ["".join(rng.choice("abcde ") for _ in range(rng.randint(0, 12))) for _ in range(n)]
+
+
+def test_levenshtein_matches_distance():
+    names = NAMES + random_names(60)
+    for a in names:
+        for b in names:
+            d = distance.levenshtein(a, b)
+            assert levenshtein(a, b) == d
+            assert normalized(a, b) == distance.levenshtein(a, b, normalized=True)
+            for bound in range(4):
+                assert levenshtein(a, b, bound) == (d if d <= bound else bound + 1)
+
+
+def test_ranking_matches_sorted_distances():
+    matcher = NameMatcher()
+    lineup = set(NAMES[1:]) | set(random_names(20, seed=1))
+    for name in NAMES + random_names(20, seed=2):
+        expected = sorted((distance.levenshtein(name, c, normalized=True), c) for c in lineup)
+        ranking = matcher.ranking(name, lineup, "Roma", 2014)
+        assert (ranking[0], ranking[1]) == (expected[0], expected[1])
+        assert list(ranking) == expected
+
+
+def test_word_matches():
+    matcher = NameMatcher()
+    lineup = {"marco conti", "daniele de rossi", "francesco totti", "conti"}
+    set_to_lineup, lineup_to_set = matcher.word_matches(["conti", "de rossi", "totti", "rossi daniele"], lineup,
+                                                        "Roma", 2014)
+    assert set_to_lineup == {"conti": ["marco conti"], "de rossi": ["daniele de rossi"],
+                             "totti": ["francesco totti"], "rossi daniele": ["daniele de rossi"]}
+    assert lineup_to_set["daniele de rossi"] == ["de rossi", "rossi daniele"]
+    # candidates of other lineups of the same team and season are not matched
+    assert matcher.word_matches(["conti"], {"paolo mancini"}, "Roma", 2014) == ({}, {})
+
+
+def test_indexes_are_capped():
+    matcher = NameMatcher(max_indexes=2)
+    matcher.ranking("conti", {"marco conti"}, "Roma", 2014)[0]
+    roma = matcher.index("Roma", 2014)
+    matcher.index("Lazio", 2014)
+    matcher.index("Roma", 2014)
+    matcher.index("Milan", 2014)
+    assert matcher.index("Roma", 2014) is roma
+    assert set(matcher._indexes) == {("Roma", 2014), ("Milan", 2014)}
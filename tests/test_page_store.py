@@ -0,0 +1,50 @@
+import time
+
+from page_store import PageStore
+
+URL = "https://int.soccerway.com/players/marco-conti/100/"
+
+
+def test_pages_and_validators_survive_a_restart(tmp_path):
+    store = PageStore(str(tmp_path))
+    sha = store.put(URL, "<html>zażółć</html>", etag='"abc"', modified="Sun, 15 Sep 2013 12:00:00 GMT")
+    store.put(URL + "other/", "<html>zażółć</html>")
+
+    store = PageStore(str(tmp_path))
+    assert len(store) == 2 and store.get(URL) == "<html>zażółć</html>"
+    assert store.validators(URL) == ('"abc"', "Sun, 15 Sep 2013 12:00:00 GMT")
+    assert store.validators(URL + "other/") == (None, None) and store.validators("missing") == (None, None)
+    # same content, one object
+    assert store.put(URL + "other/", "<html>zażółć</html>") == sha
+    assert store.get("missing") is None
+
+
+def test_old_and_cut_index_lines(tmp_path):
+    store = PageStore(str(tmp_path))
+    sha = store.put(URL, "<html></html>")
+    with open(store.index_path, "a", encoding="utf-8") as f:
+        f.write(f"{URL}old/\t{sha}\t12.5\n")
+        f.write(f"{URL}cut/\t{sha}\t1")
+
+    store = PageStore(str(tmp_path))
+    assert store.urls() == [URL, URL + "old/"]
+    assert store.fetched_at(URL + "old/") == 12.5 and store.validators(URL + "old/") == (None, None)
+
+
+def test_fresh_touch_and_compact(tmp_path):
+    store = PageStore(str(tmp_path))
+    store.put(URL, "<html>1</html>", fetched_at=time.time() - 100, etag='"1"')
+    assert store.fresh(URL) and store.fresh(URL, 200) and not store.fresh(URL, 50)
+    assert not store.fresh("missing")
+
+    store.touch(URL)
+    assert store.fresh(URL, 50) and store.validators(URL) == ('"1"', None)
+    store.put(URL, "<html>2</html>", etag='"2"')
+    with open(store.index_path, encoding="utf-8") as f:
+        assert len(f.readlines()) == 3
+
+    store.compact()
+    with open(store.index_path, encoding="utf-8") as f:
+        assert len(f.readlines()) == 1
+    store = PageStore(str(tmp_path))
+    assert store.get(URL) == "<html>2</html>" and store.validators(URL) == ('"2"', None)
@@ -0,0 +1,113 @@
+import math
+
+import pandas as pd
+import numpy as np
+
+from stores import RowIndex, StatAccumulator, ColumnarStore, RollingHistory
+
+COLUMNS = ["id", "name", "season", "round", "goals", "fouls"]
+KEY = ["id", "season", "round"]
+
+
+def accumulator(rows):
+    acc = StatAccumulator(COLUMNS, KEY, 4, capacity=1)
+    for info, tag in rows:
+        acc.add_row(info, tag)
+    return acc
+
+
+def test_row_index():
+    index = RowIndex()
+    index.add(("a", 2012, 1), 0)
+    index.add(("a", 2012, 1), 3)
+    assert ("a", 2012, 1) in index
+    assert index.positions(("a", 2012, 1)) == [0, 3]
+    assert index.positions(("b", 2012, 1)) == []
+    assert index.first(("a", 2012, 1)) == 0
+    try:
+        index.first(("b", 2012, 1))
+        assert False
+    except KeyError:
+        pass
+
+
+def test_accumulator_matches_dataframe_masks():
+    rows = [(["a", "A", 2012, 1], True), (["b", "B", 2012, 1], False), (["c", "C", 2012, 1], True)]
+    acc = accumulator(rows)
+    df = pd.DataFrame([info + [0, 0] for info, _ in rows], columns=COLUMNS)
+
+    def mask(key):
+        return (df["id"] == key[0]) & (df["season"] == key[1]) & (df["round"] == key[2])
+
+    for key, column, value in [(("a", 2012, 1), "goals", 1), (("c", 2012, 1), "fouls", 2),
+                               (("a", 2012, 1), "goals", 1), (("x", 2012, 1), "goals", 1)]:
+        acc.add(key, column, value)
+        df.loc[mask(key), column] += value
+    acc.add_values(("b", 2012, 1), np.array([4, 5]))
+    df.loc[mask(("b", 2012, 1)), ["goals", "fouls"]] += [4, 5]
+    acc.set(("c", 2012, 1), "goals", 7)
+    df.loc[mask(("c", 2012, 1)), "goals"] = 7
+
+    assert len(acc) == 3
+    assert acc.get(("a", 2012, 1), "goals") == 2
+    pd.testing.assert_frame_equal(acc.to_frame(), df)
+
+
+def test_columnar_store_keeps_chunks_in_order():
+    first = accumulator([(["a", "A", 2012, 1], True)])
+    first.add(("a", 2012, 1), "goals")
+    second = accumulator([(["b", "B", 2012, 1], False), (["a", "A", 2012, 2], True)])
+    second.add(("a", 2012, 2), "fouls", 3)
+
+    store = ColumnarStore(COLUMNS, KEY, 4)
+    assert len(store.to_frame()) == 0
+    store.extend(first)
+    store.extend(second)
+    # later changes of an accumulator don't reach the store
+    first.add(("a", 2012, 1), "goals")
+
+    assert len(store) == 3
+    assert ("a", 2012, 2) in store and ("a", 2012, 3) not in store
+    assert list(store.tags()) == [True, False, True]
+    expected = pd.DataFrame([["a", "A", 2012, 1, 1, 0], ["b", "B", 2012, 1, 0, 0], ["a", "A", 2012, 2, 0, 3]],
+                            columns=COLUMNS)
+    pd.testing.assert_frame_equal(store.to_frame(), expected)
+
+
+def test_rolling_history():
+    history = RollingHistory(maxlen=2)
+    for day, result in enumerate(["W", "D", "L"], 1):
+        history.add(result, day, np.array([day, 1]), np.eye(3)[day - 1])
+
+    assert len(history) == 3
+    # totals cover every entry, even the ones dropped by maxlen
+    assert list(history.total) == [6, 3]
+    assert list(history.results) == [1, 1, 1]
+    assert [entry[0] for entry in history.latest(5)] == ["L", "D"]
+    assert [entry[0] for entry in history.since(3)] == ["L"]
+
+
+def test_rolling_history_since_unordered():
+    history = RollingHistory()
+    for day in [1, 3, 2]:
+        history.add("W", day, np.zeros(1), np.zeros(3))
+    assert sorted(entry[1] for entry in history.since(2)) == [2, 3]
+
+
+def test_rolling_history_total_is_exact():
+    rng = np.random.default_rng(0)
+    stats = [rng.integers(0, 5, 3) / rng.integers(1, 7) for _ in range(500)] + [np.array([1e16, 1.0, -1e16])]
+    history = RollingHistory(maxlen=1)
+    for day, stat in enumerate(stats):
+        history.add("W", day, stat, np.zeros(3))
+
+    # the sum is rounded once, in any order of the entries
+    assert list(history.total) == [math.fsum(column) for column in zip(*stats)]
+    assert len(history._partials) < 10 and len(history._entries) == 1
+
+
+def test_rolling_history_integral_total_is_one_array():
+    history = RollingHistory()
+    for day in range(100):
+        history.add("W", day, np.array([day, 90]), np.zeros(3))
+    assert len(history._partials) == 1 and list(history.total) == [4950, 9000]
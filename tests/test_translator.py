@@ -0,0 +1,102 @@
+import os
+import pickle
+import subprocess
+import sys
+
+import pandas as pd
+
+from loaders import load_events, load_corrections, HOME_COLUMNS, AWAY_COLUMNS
+
+TRANSLATOR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "translator.py")
+EVENT_COLUMNS = ["id_odsp", "id_event", "event_type", "event_type2", "event_team", "opponent", "player", "player2",
+                 "player_in", "player_out"]
+
+# (id_odsp, date, home, away, home lineup, away lineup, (event_team, player) of the events)
+MATCHES = [("m1", "2014-01-05", "Roma", "Lazio", ["marco conti", "paolo rossi", "luca verdi"],
+            ["aldo bianchi", "carlo neri", "dino gialli"],
+            # conti pairs by words, xavier can't be paired, bianchi of Lazio is in an event of Roma
+            [("Roma", "conti"), ("Roma", "xavier quux"), ("Roma", "aldo bianchi"), ("Lazio", "carlo neri")]),
+           ("m2", "2014-01-12", "Milan", "Napoli", ["enzo bruni", "fabio grigi", "gino rosa"],
+            ["mario marrone", "lino viola", "nico ocra"],
+            [("Milan", "ywzzy"), ("Napoli", "enzo bruni"), ("Napoli", "nico ocra")])]
+
+
+def write_dataset(root, lineups_of=("m1", "m2")):
+    ginf = pd.DataFrame([(match_id, True, date, "I1", 2014, "italy", home, away, 0, 0)
+                         for match_id, date, home, away, *_ in MATCHES],
+                        columns=["id_odsp", "adv_stats", "date", "league", "season", "country", "ht", "at", "fthg",
+                                 "ftag"])
+    events = pd.DataFrame([(match_id, f"{match_id}e{i}", 1, None, team, away if team == home else home, player, None,
+                            None, None)
+                           for match_id, _, home, away, _, _, evs in MATCHES for i, (team, player) in enumerate(evs)],
+                          columns=EVENT_COLUMNS)
+    lineups = pd.DataFrame([[2014, date, home] + (home_players + [None] * 23)[:23] + [away] +
+                            (away_players + [None] * 23)[:23]
+                            for match_id, date, home, away, home_players, away_players, _ in MATCHES
+                            if match_id in lineups_of],
+                           columns=["season", "date", "home_team"] + HOME_COLUMNS + ["away_team"] + AWAY_COLUMNS)
+    ginf.to_csv(os.path.join(root, "ginf.csv"), index=False)
+    events.to_csv(os.path.join(root, "events.csv"), index=False)
+    lineups.to_csv(os.path.join(root, "lineups.csv"), index=False)
+
+
+def translate(root, *args):
+    return subprocess.run([sys.executable, TRANSLATOR, *args], cwd=root, capture_output=True, text=True,
+                          stdin=subprocess.DEVNULL)
+
+
+def saved_names(root):
+    with open(os.path.join(root, "valid_player_names.pkl"), "rb") as f:
+        return pickle.load(f)
+
+
+def saved_conflicts(root):
+    return set(pd.read_csv(os.path.join(root, "name_conflicts.csv"))["name"])
+
+
+def test_interrupted_batch_run_keeps_its_conflicts_and_resumes(tmp_path):
+    root = str(tmp_path)
+    # the lineup of m2 is missing, the run stops there
+    write_dataset(root, lineups_of=("m1",))
+    assert translate(root, "--batch").returncode != 0
+    assert saved_conflicts(root) == {"xavier quux"}
+    assert saved_names(root)[("conti", "Roma", 2014)] == "marco conti"
+
+    write_dataset(root)
+    result = translate(root, "--from", "1", "--batch")
+    assert result.returncode == 0, result.stderr
+    assert saved_conflicts(root) == {"xavier quux", "ywzzy"}
+    names = saved_names(root)
+    assert names[("conti", "Roma", 2014)] == "marco conti"
+    conflicts = pd.read_csv(os.path.join(root, "name_conflicts.csv")).set_index("name")
+    assert conflicts.loc["xavier quux", "match_id"] == "m1" and conflicts.loc["ywzzy", "match_id"] == "m2"
+    assert "marco conti (" in conflicts.loc["xavier quux", "candidates"]
+
+
+def saved_corrections(root):
+    corrections = pd.read_csv(os.path.join(root, "event_corrections.csv"))
+    return dict(zip(corrections["id_event"], corrections["swap"]))
+
+
+def test_corrections_are_kept_between_runs(tmp_path, monkeypatch):
+    root = str(tmp_path)
+    write_dataset(root, lineups_of=("m1",))
+    translate(root, "--batch")
+    assert saved_corrections(root) == {"m1e2": True}
+
+    # the resumed run adds its corrections to the saved ones
+    write_dataset(root)
+    assert translate(root, "--from", "1", "--batch").returncode == 0
+    assert saved_corrections(root) == {"m1e2": True, "m2e1": True}
+
+    # a run over all matches reads the corrected events, the saved swaps are not undone
+    result = translate(root, "--batch")
+    assert result.returncode == 0, result.stderr
+    assert "SHOULD BELONG" not in result.stdout
+    assert saved_corrections(root) == {"m1e2": True, "m2e1": True}
+
+    # database_build loads the events the same way
+    monkeypatch.chdir(tmp_path)
+    events = load_events("events.csv", load_corrections("event_corrections.csv")).events.set_index("id_event")
+    assert list(events.loc["m1e2", ["event_team", "opponent"]]) == ["Lazio", "Roma"]
+    assert list(events.loc["m2e1", ["event_team", "opponent"]]) == ["Milan", "Napoli"]
@@ -0,0 +1,152 @@
+import pandas as pd
+import pytest
+from bs4 import BeautifulSoup
+
+import web_crawl
+from crawl_pool import FetchPool, RateLimiter, HttpFetcher
+from page_store import PageStore
+from journal import CacheJournal
+
+MATCH = "/matches/2013/09/15/italy/serie-a/roma/lazio/1/"
+NO_LINEUP = "/matches/2013/09/22/italy/serie-a/milan/napoli/2/"
+
+
+@pytest.fixture
+def site(soccerway, tmp_path, monkeypatch):
+    monkeypatch.setattr(web_crawl, "SITE", soccerway)
+    monkeypatch.setattr(web_crawl, "pages", PageStore(str(tmp_path / "pages")))
+    monkeypatch.setattr(web_crawl, "http", None)
+    monkeypatch.setattr(web_crawl, "limiter", RateLimiter(0))
+    return soccerway
+
+
+def store_fetcher():
+    return HttpFetcher(store=web_crawl.page_store())
+
+
+def new_lineups():
+    names = [f"{first_xi}{no}" for first_xi in ["p", "s"] for no in range(1, 12)] + ["s12"]
+    return web_crawl.LineupBuffer(pd.DataFrame(columns=["season", "date", "home_team"] + [f"h{n}" for n in names] +
+                                               ["away_team"] + [f"a{n}" for n in names]))
+
+
+def test_parse_player(site):
+    soup = web_crawl.get_page(site + "/players/marco-conti/100/", verbose=False)
+    assert web_crawl.parse_player(soup) == ("marco conti", 80, 175, "Goalkeeper")
+    # no weight on the page
+    soup = web_crawl.get_page(site + "/players/paolo-mancini/103/", verbose=False)
+    name, weight, height, pos = web_crawl.parse_player(soup)
+    assert name == "paolo mancini" and weight != weight and pos == "Defender"
+
+
+def test_pool_pages_are_merged_into_the_cache(site):
+    cache, lineups = web_crawl.Cache(), new_lineups()
+    pool = FetchPool(store_fetcher, n_workers=4, limiter=RateLimiter(0), verbose=False)
+
+    match_soups = {link: BeautifulSoup(html, web_crawl.PARSER)
+                   for link, html in web_crawl.get_pages(pool, [site + MATCH, site + NO_LINEUP])}
+    player_urls = web_crawl.lineup_player_urls(match_soups[site + MATCH])
+    assert len(player_urls) == 26 and web_crawl.lineup_player_urls(match_soups[site + NO_LINEUP]) == []
+    for url, html in web_crawl.get_pages(pool, [site + url for url in player_urls]):
+        web_crawl.record_player(cache, url[len(site):], *web_crawl.parse_player(BeautifulSoup(html, web_crawl.PARSER)))
+    assert cache.visited == set(player_urls)
+
+    # every player is in the cache already, get_lineup only names them
+    row = web_crawl.get_lineup(cache, "Roma", "Lazio", 2013, match_soups[site + MATCH], lineups, verbose=False)
+    assert row[:4] == [2013, "2013-09-15", "Roma", "marco conti"]
+    assert row[26] == "Lazio" and row[27] == "marco marino"
+    assert (2013, "Roma", "Lazio") in lineups and cache.name_to_url[("marco conti", 2013, "Roma")] == player_urls[0]
+
+    row = web_crawl.get_lineup(cache, "Milan", "Napoli", 2013, match_soups[site + NO_LINEUP], lineups, verbose=False)
+    assert cache.missing_data[("Milan", "Napoli", 2013)] == web_crawl.NO_LINEUP
+    assert len(lineups.to_frame()) == 2
+
+
+def test_stored_pages_are_not_fetched_again(site):
+    pool = FetchPool(store_fetcher, n_workers=2, limiter=RateLimiter(0), verbose=False)
+    first = dict(web_crawl.get_pages(pool, [site + MATCH]))
+
+    class Offline:
+        def fetch_all(self, urls):
+            assert not urls
+            return iter(())
+
+    assert dict(web_crawl.get_pages(Offline(), [site + MATCH])) == first
+
+
+def test_stale_pages_are_revalidated(site, soccerway_server, monkeypatch):
+    link = site + MATCH
+    html = web_crawl.get_page(link, verbose=False)
+    modified = web_crawl.page_store().validators(link)[1]
+    assert modified is not None and soccerway_server.log == [(MATCH, 200)]
+
+    web_crawl.page_store().touch(link, fetched_at=0)
+    monkeypatch.setattr(web_crawl, "PAGE_TTL", 60)
+    # the page hasn't changed, the site answers 304 and the stored copy is fresh again
+    assert web_crawl.get_page(link, verbose=False) == html
+    assert soccerway_server.log[-1] == (MATCH, 304) and web_crawl.page_store().fresh(link, 60)
+    assert web_crawl.get_page(link, verbose=False) == html and len(soccerway_server.log) == 2
+
+
+def test_reparse_refreshes_players_from_the_stored_pages(site, tmp_path, monkeypatch):
+    player_urls = ["/players/marco-conti/100/", "/players/paolo-mancini/103/"]
+    for url in player_urls:
+        web_crawl.get_page(site + url, verbose=False)
+    web_crawl.get_page(site + player_urls[0], verbose=False)
+    web_crawl.page_store().touch(site + player_urls[0])
+
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(web_crawl, "leagues", None)  # the leagues are not crawled
+    web_crawl.crawl(verbose=False, start_new=True, reparse=True)
+
+    cache = web_crawl.Cache.load_cache()
+    assert cache.visited == set(player_urls) and cache.player_pos[player_urls[0]] == "Goalkeeper"
+    assert cache.url_to_name[player_urls[1]] == "paolo mancini"
+    assert len(pd.read_csv("lineups.csv")) == 0
+    # the line of the touched page is gone
+    with open(web_crawl.page_store().index_path, encoding="utf-8") as f:
+        assert len(f.readlines()) == 2
+
+
+def test_reparse_moves_the_name_of_a_renamed_player(site, tmp_path):
+    url = "/players/marco-conti/100/"
+    cache = web_crawl.Cache(str(tmp_path) + "/")
+    web_crawl.record_player(cache, url, *web_crawl.parse_player(web_crawl.get_page(site + url, verbose=False)))
+    cache.name_to_url[("marco conti", 2013, "Roma")] = url
+    cache.name_to_url[("marco conti", 2013, "Lazio")] = "/players/marco-conti/999/"
+
+    cache.journal = CacheJournal(str(tmp_path / web_crawl.DATASET_DIR))
+    html = web_crawl.page_store().get(site + url)
+    web_crawl.page_store().put(site + url, html.replace("Marco Conti", "Marco Conte"))
+    web_crawl.reparse_players(cache, n_jobs=1)
+    cache.journal.close()
+
+    assert cache.url_to_name[url] == "marco conte"
+    assert cache.name_to_url == {("marco conte", 2013, "Roma"): url,
+                                 ("marco conti", 2013, "Lazio"): "/players/marco-conti/999/"}
+    # the journal of the run gives the same map
+    replayed, lineups = web_crawl.Cache(str(tmp_path) + "/"), new_lineups()
+    replayed.name_to_url[("marco conti", 2013, "Roma")] = url
+    web_crawl.replay_journal(replayed, lineups)
+    assert replayed.name_to_url == {("marco conte", 2013, "Roma"): url}
+
+
+def test_pool_interval_shares_the_request_interval():
+    assert web_crawl.pool_interval(2, 1) == 2
+    assert web_crawl.pool_interval(2, 2) == 1
+    assert web_crawl.pool_interval(2, 16) == web_crawl.MIN_POOL_INTERVAL
+    assert web_crawl.pool_interval(0, 4) == 0
+
+
+def test_player_fetched_by_the_pool_cant_take_a_name(site):
+    url = "/players/marco-conti/100/"
+    cache = web_crawl.Cache()
+    web_crawl.record_player(cache, url, *web_crawl.parse_player(web_crawl.get_page(site + url, verbose=False)))
+    cache.fetched.add(url)
+    cache.name_to_url[("marco conti", 2013, "Roma")] = "/players/marco-conti/999/"
+    with pytest.raises(AssertionError):
+        web_crawl.get_player_data(cache, url, 2013, "Roma", verbose=False)
+
+    # after the first name it is looked up like any visited url
+    assert web_crawl.get_player_data(cache, url, 2013, "Lazio", verbose=False) == "marco conti"
+    assert cache.name_to_url[("marco conti", 2013, "Lazio")] == url